@@ -0,0 +1,265 @@
+import argparse
+import sys
+import time
+import tracemalloc
+
+import numpy as np
+import pandas as pd
+
+from soil_scripts import csr2
+from soil_scripts.csr2_dcts import (
+    DCT_EJ_ADD, DCT_EJ_SUBST, DCT_MFAC, DCT_SFAC
+)
+
+# Synthetic gSSURGO-like tables for CSR2 calculation, values are drawn from
+# csr2 dictionaries and class names used by calc_* functions, so all
+# branches of factors are hit. No geodatabase nor db is needed.
+MONTHS = [
+    'January', 'February', 'March', 'April', 'May', 'June', 'July',
+    'August', 'September', 'October', 'November', 'December',
+]
+COMPNAMES = [
+    *DCT_EJ_SUBST, *DCT_EJ_ADD, 'Clarion', 'Nicollet', 'Webster',
+    'Canisteo', 'Histosols', 'Gullied Land', 'Urban Land', 'Pits',
+]
+SUBGROUPS = [*DCT_SFAC, 'Typic Haplustepts', 'Typic Udorthents']
+PARTSIZES = [
+    *DCT_MFAC, 'loamy-skeletal', 'clayey-skeletal', 'fine-loamy, calcareous',
+    'loamy-skeletal, calcareous', 'fine-silty, mixed',
+]
+FLOOD_FREQ = ['None', 'Rare', 'Occasional', 'Frequent', 'Very frequent']
+FLOOD_DUR = [
+    'Extremely brief (0.1 to 4 hours)', 'Very brief (4 to 48 hours)',
+    'Brief (2 to 7 days)', 'Long (7 to 30 days)',
+    'Very long (more than 30 days)',
+]
+POND_FREQ = ['None', 'Rare', 'Occasional', 'Frequent']
+POND_DUR = [
+    'Very Brief', 'Brief (2 to 7 days)', 'Long (7 to 30 days)',
+    'Very long (more than 30 days)',
+]
+
+
+def pick(rng, values: list, size: int, missing: float = 0) -> np.ndarray:
+    """Random values, missing part of them set to None"""
+    out = np.array(values, dtype=object)[rng.integers(len(values), size=size)]
+    if missing > 0:
+        out[rng.random(size) < missing] = None
+    return out
+
+
+def with_nan(rng, values: np.ndarray, missing: float) -> np.ndarray:
+    values = values.astype(float)
+    values[rng.random(values.shape[0]) < missing] = np.nan
+    return values
+
+
+def make_tables(mukeys: int, seed: int = 0, missing: float = 0.05) -> dict:
+    """
+    Synthetic mapunit, muaggatt, component, comonth and chorizon tables
+    (csr2_table kwargs) with mukeys map units, 1-4 components per map unit,
+    12 months and 0-5 horizons per component. missing - part of attributes
+    set to None/NaN
+    """
+    rng = np.random.default_rng(seed)
+    mks = np.array([str(100000 + xx) for xx in range(mukeys)], dtype=object)
+    musym = np.array(
+        [f'{xx}{yy}' for xx, yy in zip(
+            rng.integers(1, 999, mukeys), pick(rng, list('ABCDEF'), mukeys)
+        )], dtype=object
+    )
+    musym[rng.random(mukeys) < 0.02] = '221B'
+    mapunit = pd.DataFrame({
+        'mukey': mks,
+        'musym': musym,
+        'muname': [f'map unit {xx}' for xx in mks],
+    })
+    muaggatt = mapunit[['mukey', 'musym']].copy()
+
+    ncomp = rng.integers(1, 5, mukeys)
+    size = int(ncomp.sum())
+    cokeys = np.array([str(xx) for xx in range(1, size + 1)], dtype=object)
+    component = pd.DataFrame({
+        'mukey': np.repeat(mks, ncomp),
+        'cokey': cokeys,
+        'majcompflag': pick(rng, ['Yes', 'No'], size),
+        'comppct_r': with_nan(
+            rng, rng.integers(1, 20, size) * 5, missing / 5
+        ),
+        'compname': np.where(
+            rng.random(size) < 0.3,
+            pick(rng, COMPNAMES, size),
+            pick(rng, ['Clarion', 'Nicollet', 'Webster'], size),
+        ),
+        'compkind': pick(rng, ['Series', 'Taxadjunct', 'Variant'], size),
+        'localphase': pick(rng, ['channeled', 'overwash', 'stony'], size, 0.7),
+        'taxsubgrp': pick(rng, SUBGROUPS, size, missing),
+        'taxpartsize': pick(rng, PARTSIZES, size, missing),
+        'tfact': with_nan(rng, rng.integers(1, 6, size), missing),
+        'slope_r': with_nan(
+            rng, np.round(rng.gamma(1.5, 3, size), 1), missing
+        ),
+        'erocl': pick(
+            rng, ['None - deposition', 'Class 1', 'Class 2', 'Class 3'],
+            size, missing
+        ),
+        'nirrcapcl': with_nan(rng, rng.integers(1, 9, size), missing),
+        'nirrcapscl': pick(rng, ['e', 'w', 's', 'c'], size, missing),
+    })
+
+    comonth = pd.DataFrame({
+        'cokey': np.repeat(cokeys, len(MONTHS)),
+        'month': np.tile(np.array(MONTHS, dtype=object), size),
+        'flodfreqcl': pick(rng, FLOOD_FREQ, size * 12, missing),
+        'floddurcl': pick(rng, FLOOD_DUR, size * 12, 0.5),
+        'pondfreqcl': pick(rng, POND_FREQ, size * 12, missing),
+        'ponddurcl': pick(rng, POND_DUR, size * 12, 0.5),
+    })
+
+    nhz = rng.integers(0, 6, size)
+    hsize = int(nhz.sum())
+    thick = rng.integers(5, 60, hsize)
+    bottom = np.cumsum(thick)
+    # depths restart on first horizon of every component
+    first = np.repeat(np.cumsum(nhz) - nhz, nhz)
+    offset = np.concatenate([[0], bottom])[first]
+    chorizon = pd.DataFrame({
+        'cokey': np.repeat(cokeys, nhz),
+        'hzdept_r': bottom - thick - offset,
+        'hzdepb_r': bottom - offset,
+        'awc_r': with_nan(
+            rng, np.round(rng.uniform(0.01, 0.25, hsize), 2), missing
+        ),
+    })
+    return {
+        'mapunit': mapunit,
+        'component': component,
+        'muaggatt': muaggatt,
+        'comonth': comonth,
+        'chorizon': chorizon,
+    }
+
+
+def reference_table(mapunit, component, muaggatt, comonth,
+                    chorizon) -> tuple:
+    """
+    csr2 by calc_csr2 called for every mukey (previous process_csr2 loop),
+    returns (DataFrame mukey, csr2; list of mukeys calc_csr2 failed on)
+    """
+    saved = csr2.dct_ej_add
+    csr2.dct_ej_add = csr2.ej_additions(muaggatt)
+    rows = []
+    errors = []
+    try:
+        for mukey in mapunit.mukey.values:
+            try:
+                val = csr2.calc_csr2(
+                    mukey, component=component, comnth=comonth, cho=chorizon
+                )
+                rows.append((mukey, val))
+            except Exception:
+                errors.append(mukey)
+    finally:
+        csr2.dct_ej_add = saved
+    return pd.DataFrame(rows, columns=['mukey', 'csr2']), errors
+
+
+def vectorized_table(mapunit, component, muaggatt, comonth,
+                     chorizon) -> tuple:
+    """csr2 by calc_csr2_all (as csr2_table, without logging to db)"""
+    df = csr2.calc_csr2_all(
+        component, comonth, chorizon, csr2.ej_additions(muaggatt)
+    )
+    return mapunit[['mukey']].merge(df, on='mukey'), []
+
+
+IMPLEMENTATIONS = {
+    'calc_csr2': reference_table,
+    'calc_csr2_all': vectorized_table,
+}
+
+
+def measure(func, tables: dict) -> tuple:
+    """
+    Runs implementation, returns (result, mukeys it failed on, seconds, peak
+    MB)
+    """
+    tracemalloc.start()
+    start = time.perf_counter()
+    df, errors = func(**tables)
+    seconds = time.perf_counter() - start
+    peak = tracemalloc.get_traced_memory()[1] / 1024 ** 2
+    tracemalloc.stop()
+    return df, errors, seconds, peak
+
+
+def compare(ref: pd.DataFrame, out: pd.DataFrame) -> pd.DataFrame:
+    """
+    Rows of mukeys where outputs differ - other value (values are compared
+    exactly) or mukey produced by only one side, column side is 'both',
+    'ref only' or 'out only'
+    """
+    df = ref.merge(out, on='mukey', how='outer', suffixes=('_ref', '_out'),
+                   indicator='side')
+    df['side'] = df.side.astype(str).map(
+        {'both': 'both', 'left_only': 'ref only', 'right_only': 'out only'}
+    )
+    return df[~(df.csr2_ref.astype(float) == df.csr2_out.astype(float))]
+
+
+def run(sizes: list, seed: int, missing: float, reference_max: int) -> int:
+    """
+    Prints timing table and mismatches, returns number of mismatches - other
+    csr2 or mukey produced by only one implementation
+    """
+    print(f'{"mukeys":>8} {"components":>10} {"implementation":>15} '
+          f'{"seconds":>9} {"peak MB":>8} {"errors":>6} {"diff":>6} '
+          f'{"ref only":>8} {"out only":>8}')
+    mismatches = 0
+    for size in sizes:
+        tables = make_tables(size, seed, missing)
+        ncomp = tables['component'].shape[0]
+        results = {}
+        for name, func in IMPLEMENTATIONS.items():
+            if name == 'calc_csr2' and size > reference_max:
+                continue
+            df, errors, seconds, peak = measure(func, tables)
+            results[name] = df
+            diff = ref_only = out_only = ''
+            if name != 'calc_csr2' and 'calc_csr2' in results:
+                bad = compare(results['calc_csr2'], df)
+                out_only = (bad.side == 'out only').sum()
+                ref_only = (bad.side == 'ref only').sum()
+                diff = (bad.side == 'both').sum()
+                mismatches += bad.shape[0]
+                if bad.shape[0] > 0:
+                    print(bad.head(10).to_string(index=False))
+            print(f'{size:>8} {ncomp:>10} {name:>15} {seconds:>9.3f} '
+                  f'{peak:>8.1f} {len(errors):>6} {diff:>6} {ref_only:>8} '
+                  f'{out_only:>8}')
+    return mismatches
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(
+        description='Compare CSR2 implementations on synthetic tables'
+    )
+    parser.add_argument(
+        '--sizes', type=int, nargs='+', default=[100, 1000, 10000],
+        help='numbers of map units (mukeys) of generated tables'
+    )
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument(
+        '--missing', type=float, default=0.05,
+        help='part of attributes set to None/NaN'
+    )
+    parser.add_argument(
+        '--reference-max', type=int, default=2000,
+        help='calc_csr2 loop is run only up to this number of mukeys'
+    )
+    args = parser.parse_args()
+
+    sys.exit(
+        1 if run(args.sizes, args.seed, args.missing, args.reference_max)
+        else 0
+    )
@@ -0,0 +1,182 @@
+import argparse
+import os
+import shutil
+import sys
+import tempfile
+import time
+from zipfile import ZIP_DEFLATED, ZipFile
+
+import geopandas as gpd
+import numpy as np
+import pandas as pd
+from shapely.geometry import Polygon
+
+from soil_scripts import reader
+
+# Synthetic gSSURGO-like geodatabase (mupolygon layer and attribute tables)
+# packed to zip the same way as state downloads, layers are read as import
+# reads them - after extracting zip and straight from zip (/vsizip/)
+STATE = 'XX'
+GDB = f'gSSURGO_{STATE}.gdb'
+TABLES = ['mapunit', 'component']
+
+
+def make_gdb(folder: str, features: int, seed: int = 0) -> str:
+    """
+    Writes geodatabase with features mupolygons (squares in EPSG:5070 grid
+    with few vertices more), one mapunit per 10 polygons and 3 components
+    per mapunit, returns path of zip with geodatabase
+    """
+    rng = np.random.default_rng(seed)
+    dbf = os.path.join(folder, GDB)
+    side = int(np.ceil(np.sqrt(features)))
+    xx = np.arange(features) % side * 100.0
+    yy = np.arange(features) // side * 100.0
+    mukeys = np.array(
+        [str(100000 + kk) for kk in rng.integers(0, features // 10 + 1,
+                                                 features)],
+        dtype=object
+    )
+    # square with vertex every 10 m
+    step = np.arange(0, 100, 10.0)
+    ring = np.concatenate([
+        np.column_stack([step, np.zeros(10)]),
+        np.column_stack([np.full(10, 100.0), step]),
+        np.column_stack([100 - step, np.full(10, 100.0)]),
+        np.column_stack([np.zeros(10), 100 - step]),
+    ])
+    geoms = [Polygon(ring + [x0, y0]) for x0, y0 in zip(xx, yy)]
+    gpd.GeoDataFrame({
+        'AREASYMBOL': f'{STATE}001',
+        'SPATIALVER': np.int32(1),
+        'MUSYM': mukeys,
+        'MUKEY': mukeys,
+    }, geometry=geoms, crs=5070).to_file(
+        dbf, layer='mupolygon', driver='OpenFileGDB'
+    )
+
+    units = np.unique(mukeys)
+    pd_tables = {
+        'mapunit': pd.DataFrame({
+            'mukey': units,
+            'musym': units,
+            'muname': [f'map unit {kk}' for kk in units],
+        }),
+        'component': pd.DataFrame({
+            'mukey': np.repeat(units, 3),
+            'cokey': [str(kk) for kk in range(units.shape[0] * 3)],
+            'comppct_r': (
+                rng.integers(1, 20, units.shape[0] * 3) * 5
+            ).astype('int32'),
+            'compname': 'Clarion',
+        }),
+    }
+    for tab, df in pd_tables.items():
+        gpd.GeoDataFrame(df).to_file(dbf, layer=tab, driver='OpenFileGDB')
+
+    dbz = os.path.join(folder, f'gSSURGO_{STATE}.zip')
+    with ZipFile(dbz, 'w', ZIP_DEFLATED) as zf:
+        for root, _, files in os.walk(dbf):
+            for fl in files:
+                pth = os.path.join(root, fl)
+                zf.write(pth, os.path.relpath(pth, folder))
+    shutil.rmtree(dbf)
+    return dbz
+
+
+def read_layers(dbf: str) -> dict:
+    """Reads layers as import does, returns number of rows per layer"""
+    rows = {'mupolygon': 0}
+    for df, _ in reader.iter_batches(dbf, 'mupolygon'):
+        rows['mupolygon'] += df.shape[0]
+    for tab in TABLES:
+        df = gpd.read_file(dbf, layer=tab, ignore_geometry=True)
+        rows[tab] = df.shape[0]
+    return rows
+
+
+def folder_size(folder: str) -> int:
+    return sum(
+        os.path.getsize(os.path.join(root, fl))
+        for root, _, files in os.walk(folder) for fl in files
+    )
+
+
+def extracted(dbz: str) -> tuple:
+    """Extract, read, delete (extract_state, remove_state)"""
+    folder = os.path.dirname(dbz)
+    dbf = os.path.join(folder, GDB)
+    with ZipFile(dbz, 'r') as zf:
+        zf.extractall(folder)
+    written = folder_size(dbf)
+    rows = read_layers(dbf)
+    shutil.rmtree(dbf)
+    return rows, written
+
+
+def zipped(dbz: str) -> tuple:
+    """Layers read from zip (READ_FROM_ZIP)"""
+    return read_layers(reader.vsi_path(dbz, GDB)), 0
+
+
+MODES = {
+    'extract': extracted,
+    'vsizip': zipped,
+}
+
+
+def run(sizes: list, seed: int, repeat: int, workdir: str = None) -> int:
+    """Prints timing table, returns number of layers with other row count"""
+    print(f'{"features":>9} {"zip MB":>7} {"mode":>8} {"seconds":>8} '
+          f'{"written MB":>10} {"rows":>9} {"diff":>5}')
+    mismatches = 0
+    for size in sizes:
+        folder = tempfile.mkdtemp(dir=workdir)
+        try:
+            dbz = make_gdb(folder, size, seed)
+            zip_mb = os.path.getsize(dbz) / 1024 ** 2
+            results = {}
+            for name, func in MODES.items():
+                seconds = []
+                for _ in range(repeat):
+                    start = time.perf_counter()
+                    rows, written = func(dbz)
+                    seconds.append(time.perf_counter() - start)
+                results[name] = rows
+                diff = ''
+                if name != 'extract':
+                    diff = sum(
+                        rows.get(tab) != cnt
+                        for tab, cnt in results['extract'].items()
+                    )
+                    mismatches += diff
+                print(f'{size:>9} {zip_mb:>7.1f} {name:>8} '
+                      f'{min(seconds):>8.3f} {written / 1024 ** 2:>10.1f} '
+                      f'{rows["mupolygon"]:>9} {diff:>5}')
+        finally:
+            shutil.rmtree(folder)
+    return mismatches
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(
+        description='Compare reading geodatabase from extracted and not '
+                    'extracted zip on synthetic gSSURGO-like data'
+    )
+    parser.add_argument(
+        '--sizes', type=int, nargs='+', default=[10000, 100000],
+        help='numbers of mupolygons in generated geodatabase'
+    )
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument(
+        '--repeat', type=int, default=3,
+        help='runs of every mode, best time is printed'
+    )
+    parser.add_argument(
+        '--workdir', default=None,
+        help='folder for generated files (disk used by import), system '
+             'temp folder by default'
+    )
+    args = parser.parse_args()
+
+    sys.exit(1 if run(args.sizes, args.seed, args.repeat, args.workdir) else 0)
@@ -287,7 +287,26 @@ CREATE TABLE IF NOT EXISTS ssurgo.valu1 (
 CREATE TABLE IF NOT EXISTS ssurgo.importlog (
     timelog TIMESTAMP,
     ltype VARCHAR (20),
-    description VARCHAR (254)
+    description VARCHAR (254),
+    state VARCHAR (20),
+    stage VARCHAR (50),
+    rows BIGINT,
+    duration DOUBLE PRECISION
+    );
+
+CREATE TABLE IF NOT EXISTS ssurgo.importmetrics (
+    timelog TIMESTAMP,
+    run_id VARCHAR (20),
+    state VARCHAR (20),
+    stage VARCHAR (50),
+    ok BOOLEAN,
+    seconds DOUBLE PRECISION,
+    rows_read BIGINT,
+    rows_written BIGINT,
+    rows_per_sec DOUBLE PRECISION,
+    bytes BIGINT,
+    peak_rss_mb DOUBLE PRECISION,
+    pid INTEGER
     );
 
 CREATE TABLE IF NOT EXISTS ssurgo.aggreg (
@@ -338,7 +357,7 @@ CREATE VIEW ssurgo.poly_aggreg AS
         ssurgo.mupolygon AS mp 
         LEFT JOIN ssurgo.aggreg AS ag ON (mp.mukey = ag.mukey) 
         LEFT JOIN ssurgo.aggreg_ia AS agi ON (mp.mukey=agi.mukey)
-        LEFT JOIN ssurgo.aggreg_pi AS agpi ON (mp.mukey=agi.mukey)
+        LEFT JOIN ssurgo.aggreg_pi AS agpi ON (mp.mukey=agpi.mukey)
         ;
 
 
@@ -348,3 +367,4 @@ CREATE INDEX idx_csr2 ON ssurgo.aggreg_ia (mukey);
 CREATE INDEX idx_pi ON ssurgo.aggreg_pi (mukey);
 CREATE INDEX idx_mapunit ON ssurgo.mapunit (mukey);
 CREATE INDEX idx_comp ON ssurgo.component (mukey, cokey);
+CREATE INDEX idx_sapolygon_areasymbol ON ssurgo.sapolygon (areasymbol);
@@ -0,0 +1,6 @@
+-- Indexes on keys used by import de-duplication (import_soils.dedup_key),
+-- rows of states loaded before are skipped by anti-join on these columns.
+-- Executed at the beginning of import, so older databases get them too
+CREATE INDEX IF NOT EXISTS idx_sapolygon_areasymbol ON ssurgo.sapolygon (areasymbol);
+CREATE INDEX IF NOT EXISTS idx_comp ON ssurgo.component (mukey, cokey);
+CREATE INDEX IF NOT EXISTS idx_mapunit ON ssurgo.mapunit (mukey);
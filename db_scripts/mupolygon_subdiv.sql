@@ -0,0 +1,12 @@
+-- mupolygons cut by ST_Subdivide to pieces with limited number of vertices,
+-- GIST index on small pieces filters much better than on large multipolygons.
+-- Filled after import (import_soils.optimize_mupolygon), id points to
+-- mupolygon.id
+CREATE TABLE IF NOT EXISTS ssurgo.mupolygon_subdiv (
+    id uuid NOT NULL,
+    mukey VARCHAR (30)
+    );
+ALTER TABLE ssurgo.mupolygon_subdiv ADD COLUMN IF NOT EXISTS geometry geometry(POLYGON, 4326);
+
+CREATE INDEX IF NOT EXISTS mupolygon_subdiv_geom_idx ON ssurgo.mupolygon_subdiv USING GIST (geometry);
+CREATE INDEX IF NOT EXISTS mupolygon_subdiv_id_idx ON ssurgo.mupolygon_subdiv (id);
@@ -0,0 +1,37 @@
+-- poly_aggreg stored on disk with simplified geometries (~10 m and ~100 m
+-- tolerance) and polygon area in EPSG:5070, used by api.
+-- Filled at the end of import (import_soils.refresh_poly_aggreg), import
+-- creates it also in databases made before this script was added
+CREATE MATERIALIZED VIEW IF NOT EXISTS ssurgo.poly_aggreg_mat AS
+    SELECT
+        mp.id,
+        mp.mukey,
+        mp.musym,
+        mp.state,
+        ag.muname,
+        ag.nccpi3corn,
+        ag.nccpi3soy,
+        ag.nccpi3cot,
+        ag.nccpi3sg,
+        ag.nccpi3all,
+        ag.csr,
+        ag.di,
+        ag.pi_forest,
+        agpi.pi,
+        round((ag.nccpi3all/100)::numeric, 6) as soil_index_base,
+        agi.csr2,
+        ag.cpi,
+        mp.geometry,
+        ST_Multi(ST_SimplifyPreserveTopology(mp.geometry, 0.00009)) AS geom_10,
+        ST_Multi(ST_SimplifyPreserveTopology(mp.geometry, 0.0009)) AS geom_100,
+        ST_Area(ST_Transform(mp.geometry, 5070)) AS area_5070
+    FROM
+        ssurgo.mupolygon AS mp
+        LEFT JOIN ssurgo.aggreg AS ag ON (mp.mukey = ag.mukey)
+        LEFT JOIN ssurgo.aggreg_ia AS agi ON (mp.mukey=agi.mukey)
+        LEFT JOIN ssurgo.aggreg_pi AS agpi ON (mp.mukey=agpi.mukey)
+    WITH NO DATA;
+
+CREATE UNIQUE INDEX IF NOT EXISTS idx_poly_aggreg_mat ON ssurgo.poly_aggreg_mat (id);
+CREATE INDEX IF NOT EXISTS poly_aggreg_mat_geom_idx ON ssurgo.poly_aggreg_mat USING GIST (geometry);
+CREATE INDEX IF NOT EXISTS poly_aggreg_mat_mukey_idx ON ssurgo.poly_aggreg_mat (mukey);
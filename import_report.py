@@ -0,0 +1,34 @@
+import argparse
+
+from soil_scripts import metrics
+
+
+def print_report(run: str = None, by: str = 'stage') -> None:
+    run, wall, df = metrics.report(run, by)
+    if run is None:
+        print('no import metrics in ssurgo.importmetrics')
+        return
+    print(f'import run {run}, wall time {wall or 0:.1f} s')
+    print(df.to_string(index=False))
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(
+        description='Summary of import stages saved in ssurgo.importmetrics'
+    )
+    parser.add_argument(
+        '--run', default=None, help='id of import run, last run by default'
+    )
+    parser.add_argument(
+        '--by', choices=['stage', 'state'], default='stage',
+        help='group stages of run by stage name or by state'
+    )
+    parser.add_argument(
+        '--runs', action='store_true', help='list import runs'
+    )
+    args = parser.parse_args()
+
+    if args.runs:
+        print(metrics.runs().to_string(index=False))
+    else:
+        print_report(args.run, args.by)
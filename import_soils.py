@@ -1,29 +1,71 @@
 import os
 import pandas as pd
+import sqlalchemy as sa
 import geopandas as gpd
 from shapely.geometry import MultiPolygon, Polygon
 
-from soil_scripts import config, db, utils
-from soil_scripts.downloader import download_ssurgo
+from soil_scripts import config, db, metrics, reader, tilecache, utils
+from soil_scripts.downloader import download_file, file_state, list_ssurgo
 from soil_scripts.csr2_scrap import process_csr2
 from soil_scripts.pi_calc import process_pi
 
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from multiprocessing import get_context
 from zipfile import ZipFile
+import argparse
+import queue
 import shutil
+import sys
+import threading
+import time
 
+# parallel import loads states to per-state tables of this schema, they are
+# merged to ssurgo schema one state at a time (see merge_state)
+STAGE_SCHEMA = 'ssurgo_stage'
+# merge order matters - mupolygons are checked against survey areas loaded
+# from previous states
+MERGE_TABLES = [
+    'mupolygon', 'sapolygon', 'aggreg', *config.IMPORT_TABLES,
+    'aggreg_ia', 'aggreg_pi',
+]
 
-def load_sapolygon(dbf: str) -> None:
+
+def destination(tab: str, state: str = None, stage: bool = False) -> dict:
+    """db.bulk_load target - ssurgo table or staging table of state"""
+    if stage:
+        return {'name': f'{tab}_{state.lower()}', 'schema': STAGE_SCHEMA}
+    return {'name': tab, 'schema': 'ssurgo'}
+
+
+def dedup_key(tab: str) -> tuple:
+    """
+    (ssurgo table, column) with keys of rows already loaded - survey areas
+    for polygons, mukeys for tables
+    """
+    if tab in ['mupolygon', 'sapolygon']:
+        return 'sapolygon', 'areasymbol'
+    return tab, 'mukey'
+
+
+def skip_loaded(tab: str, stage: bool = False) -> dict:
+    """
+    db.bulk_load de-duplication (indexed anti-join in db) of rows already
+    loaded from other states. Staged layers are not filtered - they are
+    de-duplicated during merge
+    """
+    if stage:
+        return {}
+    return {'skip': dedup_key(tab)}
+
+
+def load_sapolygon(dbf: str, state: str = None, stage: bool = False) -> None:
     """Loads survey area polygons to db. This is important layer which need be
     updated after every state import to omit duplicated mupolygons in ssurgo
     database. Some states have duplicated survey areas
     """
-    with db.sync_session() as session:
-        eng = session.get_bind()
-        askey = pd.read_sql_query(
-            'select areasymbol from ssurgo.sapolygon', con=eng
-        )
     gdf = gpd.read_file(dbf, layer='sapolygon')
-    gdf = gdf[~gdf['AREASYMBOL'].isin(askey.areasymbol.values)]
+    metrics.read(gdf)
     del gdf['Shape_Area']
     del gdf['Shape_Length']
     # turn columns names to lower to match db headers
@@ -36,102 +78,69 @@ def load_sapolygon(dbf: str) -> None:
     ]
     gdf = gdf.to_crs(epsg='4326')
     try:
-        with db.sync_session() as session:
-            eng = session.get_bind()
-            gdf.to_postgis(
-                name='sapolygon', con=eng, schema='ssurgo', if_exists='append'
-            )
+        metrics.written(db.bulk_load(
+            gdf, **destination('sapolygon', state, stage),
+            **skip_loaded('sapolygon', stage)
+        ))
     except Exception:
         utils.log_event('Failed to load sapolygon features', 'ERROR')
 
 
-def load_mupolygon(dbf: str, state: str) -> None:
+def load_mupolygon(dbf: str, state: str, stage: bool = False) -> None:
     """
-    Loads polygons to db by geopandas, its a slower but with more control over
-    the process than using ogr2ogr
+    Loads polygons to db, layer is read once in batches of
+    config.READ_BATCH_SIZE features (reader.iter_batches) and every batch is
+    copied to db with WKB geometries - reprojection and promotion to multi is
+    done by db
     """
-    sl = 0  # slice
-    utils.log_event(f'uploading mupolygon layer for state - {state}, [START]')
-    # get sourvey area keys
-    with db.sync_session() as session:
-        eng = session.get_bind()
-        askey = pd.read_sql_query(
-            'select areasymbol from ssurgo.sapolygon', con=eng
-        )
-    gdf = gpd.read_file(dbf, layer='sapolygon')
-    errors = 0
-    while True:
-        try:
-            gdf = gpd.read_file(
-                dbf, layer='mupolygon', rows=slice(sl, sl+1000)
-            )
-        except Exception:
-            utils.log_event(
-                f'Failed to load mupolygon features slice [{sl} - {sl+1000}] '
-                f'for state: {state}',
-                ltype='ERROR'
-            )
-            sl += 1000
-            errors += 1
-            if errors == 30:
-                utils.log_event(
-                    'Encounter 30 errors during loading mupolygon layer' +
-                    f' - please check this db: {state}',
-                    'ERROR'
+    utils.log_event(f'uploading mupolygon layer for state - {state}, [START]',
+                    state=state, stage='mupolygon')
+    started = time.perf_counter()
+    sl = 0  # features read
+    loaded = 0  # features written, without already loaded survey areas
+    try:
+        for df, srid in reader.iter_batches(dbf, 'mupolygon'):
+            start, sl = sl, sl + df.shape[0]
+            metrics.read(df)
+            # delete columns by ArcGIS
+            df = df.drop(columns=['shape_area', 'shape_length'],
+                         errors='ignore')
+            df['state'] = state  # add state name to column
+            # checking geometry is omitting here, check out ssurgo_stat,
+            # there is procedure to check geoemtry duplicates for state
+            # database, NOTE: data from november 2022 have no overlapping and
+            # duplicates problems in one geodatabase.
+            try:
+                # mupolygons of survey areas already loaded are skipped
+                loaded += db.bulk_load(
+                    df, srid=srid, **destination('mupolygon', state, stage),
+                    **skip_loaded('mupolygon', stage)
                 )
-                break
-            continue
-
-        # this is the end
-        if gdf.shape[0] == 0:
-            break
-
-        # if all mupolygons are already loaded to db go to next slice
-        gdf = gdf[~gdf['AREASYMBOL'].isin(askey.areasymbol.values)]
-        if gdf.shape[0] == 0:
-            sl += 1000
-            continue
-
-        gdf = gdf.to_crs(epsg='4326')
-        # delete columns by ArcGIS
-        del gdf['Shape_Area']
-        del gdf['Shape_Length']
-        # turn columns names to lower to match db headers
-        gdf.rename(columns={xx: xx.lower() for xx in gdf.columns},
-                   inplace=True)
-        # promote all geometries to multi
-        gdf["geometry"] = [
-            MultiPolygon([feature]) if isinstance(feature, Polygon)
-            else feature for feature in gdf["geometry"]
-        ]
-        gdf['state'] = state  # add state name to column
-        # checking geometry is omitting here, check out ssurgo_stat, there is
-        # procedure to check geoemtry duplicates for state database,
-        # NOTE: data from november 2022 have no overlapping and duplicates
-        # problems in one geodatabase.
-
-        try:
-            with db.sync_session() as session:
-                eng = session.get_bind()
-                gdf.to_postgis(
-                    name='mupolygon', con=eng,
-                    schema='ssurgo', if_exists='append', chunksize=500
+            except Exception:
+                utils.log_event(
+                    f'Failed to load mupolygon features [{start} - {sl}] '
+                    f'for state: {state}',
+                    ltype='ERROR'
                 )
-        except Exception:
-            utils.log_event(
-                f'Failed to load mupolygon features slice [{sl} - {sl+1000}] '
-                f'for state: {state}',
-                ltype='ERROR'
-            )
-        sl += 1000
-    utils.log_event(f'uploaded mupolygon layer for state - {state}, [END]')
+    except Exception as e:
+        utils.log_event(
+            f'Failed to read mupolygon layer after {sl} features for state: '
+            f'{state} - {e}'[:254],
+            ltype='ERROR'
+        )
+    metrics.written(loaded)
+    utils.log_event(
+        f'uploaded mupolygon layer for state - {state}, [END]', state=state,
+        stage='mupolygon', rows=loaded,
+        duration=time.perf_counter() - started
+    )
 
 
-def load_aggreg(dbf: str, state: str) -> None:
+def load_aggreg(dbf: str, state: str, stage: bool = False) -> None:
     """
-    Function downloads all mukeys values from database to avoid duplicates (
-    some states have same mukey records - no need to import them again,
-    they have the same values).
+    Function loads aggregated mukey values, mukeys already in database are
+    skipped by db to avoid duplicates (some states have same mukey records -
+    no need to import them again, they have the same values).
     inputs:
     dbf: path to esri gdb folder
     state: state shortcut ('AI')
@@ -155,19 +164,16 @@ def load_aggreg(dbf: str, state: str) -> None:
         columns={'Final_PI': 'pi_forest', 'Final_DI': 'di'}, inplace=True
     )
 
-    with db.sync_session() as session:
-        eng = session.get_bind()
-        ukey = pd.read_sql_query('select mukey from ssurgo.aggreg', con=eng)
-
     df = gpd.read_file(dbf, layer='mapunit', ignore_geometry=True)
+    metrics.read(df)
     df.rename(columns={xx: xx.lower() for xx in df.columns}, inplace=True)
     df = df.loc[:, ["mukey", "muname", "iacornsr"]]
     df.rename(columns={'iacornsr': 'csr'}, inplace=True)
-    df = df[~df['mukey'].isin(ukey.mukey.values)]
     df = df.merge(pidi, on='mukey', how='left')
     del pidi
 
     dfv = gpd.read_file(dbf, layer='valu1', ignore_geometry=True)
+    metrics.read(dfv)
     dfv.rename(columns={xx: xx.lower() for xx in dfv.columns}, inplace=True)
     dfv = dfv.loc[:, ['mukey', 'nccpi3corn', 'nccpi3soy', 'nccpi3cot',
                       'nccpi3sg', 'nccpi3all', ]]
@@ -176,108 +182,540 @@ def load_aggreg(dbf: str, state: str) -> None:
     del dfv
 
     dfc = gpd.read_file(dbf, layer='component', ignore_geometry=True)
-    sel = dfc[dfc.cropprodindex > 0][['mukey', 'comppct_r', 'cropprodindex']]
-    if sel.shape[0] > 0:
-        cpi = pd.DataFrame(columns=['mukey', 'cpi'])
-        # calculate weighted value of cpi per mukey
-        for mk, gr in sel.groupby('mukey'):
-            gr.loc[:, 'cpi'] = (gr.comppct_r/100) * gr.cropprodindex
-            cpi = pd.concat([
-                cpi,
-                pd.DataFrame({'mukey': mk, 'cpi': gr.cpi.sum()}, index=[0])
-            ],
-                ignore_index=True
-            )
-        df = df.merge(cpi, on='mukey', how='left')
+    metrics.read(dfc)
+    dfc.rename(columns={xx: xx.lower() for xx in dfc.columns}, inplace=True)
+    # components without crop productivity index are not used for cpi
+    dfc['cropprodindex'] = dfc.cropprodindex.where(dfc.cropprodindex > 0)
+    # calculate weighted values (cpi, ...) per mukey
+    wag = utils.weighted_aggregate(dfc, config.AGGREG_WEIGHTED)
+    df = df.merge(wag, on='mukey', how='left')
 
-    with db.sync_session() as session:
-        eng = session.get_bind()
-        df.to_sql(
-            name='aggreg', con=eng,
-            schema='ssurgo', if_exists='append', chunksize=400,
-            index=False
-        )
-    utils.log_event(f'uploaded aggreg table for state - {state}')
+    rows = db.bulk_load(
+        df, **destination('aggreg', state, stage),
+        **skip_loaded('aggreg', stage)
+    )
+    metrics.written(rows)
+    utils.log_event(f'uploaded aggreg table for state - {state}',
+                    state=state, stage='aggreg', rows=rows)
 
 
-def load_table(dbf: str, tab: str, ukey: list) -> bool:
+def load_table(dbf: str, tab: str, state: str = None,
+               stage: bool = False) -> bool:
     dfc = gpd.read_file(dbf, layer=tab, ignore_geometry=True)
+    metrics.read(dfc)
     dfc.rename(columns={xx: xx.lower() for xx in dfc.columns}, inplace=True)
     if dfc.shape[0] == 0:  # if table is empty omit procedure
         utils.log_event(f"empty table {tab} omit - {dbf.split('_')[-1][:-4]}")
         return True
-    dfc = dfc[~dfc['mukey'].isin(ukey)]  # omit values in db
     try:
-        with db.sync_session() as session:
-            eng = session.get_bind()
-            dfc.to_sql(
-                name=tab, con=eng, schema='ssurgo', if_exists='append',
-                chunksize=500, index=False
-            )
+        # mukeys already in db are omitted
+        metrics.written(db.bulk_load(
+            dfc, **destination(tab, state, stage), **skip_loaded(tab, stage)
+        ))
         return True
     except Exception:
         return False
 
 
-def load_tables(dbf: str, state: str) -> None:
+def load_tables(dbf: str, state: str, stage: bool = False) -> None:
     for tab in config.IMPORT_TABLES:
+        if load_table(dbf, tab, state, stage):
+            utils.log_event(f'uploaded {tab} table for state - {state}',
+                            state=state, stage=tab)
+        else:
+            utils.log_event(f'ERROR uploading {tab} table for state - {state}',
+                            ltype='ERROR', state=state, stage=tab)
+
+
+def state_bounds(dbf: str) -> list:
+    """Extent (EPSG:4326) of survey areas of state geodatabase or None"""
+    gdf = gpd.read_file(dbf, layer='sapolygon')
+    if gdf.shape[0] == 0:
+        return None
+    return list(gdf.to_crs(epsg='4326').total_bounds)
+
+
+def invalidate_tiles(bounds: list, state: str) -> None:
+    """
+    Drops cached tiles covering survey areas of imported state, extent is
+    taken from sapolygon layer of state geodatabase (see state_bounds)
+    """
+    if bounds is None:
+        return
+    deleted = tilecache.invalidate(bounds)
+    utils.log_event(f'invalidated {deleted} cached tiles for state - {state}')
+
+
+def run_db_script(session, name: str) -> None:
+    """Executes sql file from db_scripts folder"""
+    pth = os.path.join(config.BASEDIR, 'db_scripts', name)
+    with open(pth) as fl:
+        session.connection().exec_driver_sql(fl.read())
+
+
+def optimize_mupolygon() -> None:
+    """
+    Post import maintenance of mupolygon layer:
+    - mupolygons not yet subdivided are cut into ssurgo.mupolygon_subdiv
+      pieces (max config.SUBDIVIDE_VERTICES vertices), api uses them for
+      intersection tests, pieces are inserted in spatial order (geometry
+      sort order of PostGIS) so pieces close on map are close on disk
+    - planner statistics are refreshed
+    Tables are not reordered, see cluster_mupolygon
+    """
+    utils.log_event('optimizing mupolygon storage, [START]')
+    with db.sync_session() as session:
+        run_db_script(session, 'mupolygon_subdiv.sql')
+        session.execute(sa.text('''
+            INSERT INTO ssurgo.mupolygon_subdiv (id, mukey, geometry)
+            SELECT id, mukey, geometry
+            FROM (
+                SELECT
+                    mp.id,
+                    mp.mukey,
+                    ST_Subdivide(mp.geometry, :vertices) AS geometry
+                FROM ssurgo.mupolygon AS mp
+                WHERE NOT EXISTS (
+                    SELECT 1 FROM ssurgo.mupolygon_subdiv AS sd
+                    WHERE sd.id = mp.id
+                )
+            ) AS pieces
+            ORDER BY geometry
+        '''), {'vertices': config.SUBDIVIDE_VERTICES})
+        # pieces of deleted mupolygons
+        session.execute(sa.text('''
+            DELETE FROM ssurgo.mupolygon_subdiv AS sd
+            WHERE NOT EXISTS (
+                SELECT 1 FROM ssurgo.mupolygon AS mp WHERE mp.id = sd.id
+            )
+        '''))
+    utils.log_event('subdivided mupolygons')
+
+    with db.sync_session() as session:
+        for tab in ['mupolygon', 'mupolygon_subdiv']:
+            session.execute(sa.text(f'ANALYZE ssurgo.{tab}'))
+    utils.log_event('optimizing mupolygon storage, [END]')
+
+
+def cluster_mupolygon() -> None:
+    """
+    Orders mupolygon and its pieces physically by GIST indexes, so polygons
+    close on map are close on disk. Separate maintenance step, not run by
+    import - CLUSTER blocks reads of the table (API) until it is done and
+    needs free disk for a full copy of table with indexes.
+    """
+    utils.log_event('clustering mupolygon, [START]')
+    for tab, idx in [
+        ('mupolygon', 'mupolygon_geom_idx'),
+        ('mupolygon_subdiv', 'mupolygon_subdiv_geom_idx'),
+    ]:
+        with db.sync_session() as session:
+            session.execute(sa.text(f'CLUSTER ssurgo.{tab} USING {idx}'))
+            session.execute(sa.text(f'ANALYZE ssurgo.{tab}'))
+        utils.log_event(f'clustered ssurgo.{tab}')
+    utils.log_event('clustering mupolygon, [END]')
+
+
+def refresh_poly_aggreg() -> None:
+    """
+    Fills ssurgo.poly_aggreg_mat with imported data, view is created first if
+    db was made without it. When view already has data it is refreshed
+    concurrently - api can read old rows until refresh is done
+    """
+    with db.sync_session() as session:
+        populated = session.execute(sa.text(
+            "select ispopulated from pg_matviews "
+            "where schemaname = 'ssurgo' and matviewname = 'poly_aggreg_mat'"
+        )).scalar()
+        if populated is None:
+            run_db_script(session, 'poly_aggreg_mat.sql')
+        concurrently = 'CONCURRENTLY ' if populated else ''
+        session.execute(sa.text(
+            f'REFRESH MATERIALIZED VIEW {concurrently}ssurgo.poly_aggreg_mat'
+        ))
+        session.execute(sa.text('ANALYZE ssurgo.poly_aggreg_mat'))
+    utils.log_event('refreshed poly_aggreg_mat view')
+
+
+def extract_state(st: str) -> str:
+    """
+    Unpacks downloaded geodatabase of state, returns its path or None. With
+    config.READ_FROM_ZIP zip is not unpacked - GDAL path of geodatabase
+    inside zip is returned (reader.vsi_path), with config.ZIP_MIRROR_URL
+    path of geodatabase inside remote zip
+    """
+    gdb = f'gSSURGO_{st}.gdb'
+    if config.ZIP_MIRROR_URL:
+        return reader.vsi_path(config.ZIP_MIRROR_URL.format(state=st), gdb)
+    dbz = os.path.join(config.DOWNLOAD_FOLDER, f'gSSURGO_{st}.zip')
+    dbf = os.path.join(config.DOWNLOAD_FOLDER, gdb)
+    if not os.path.isdir(dbf):
+        if not os.path.isfile(dbz):
+            utils.log_event(f'Didn\'t find zip SSURGO for state: {st}')
+            return None
+        if config.READ_FROM_ZIP:
+            return reader.vsi_path(dbz, gdb)
+        with metrics.measure(st, 'unzip'), ZipFile(dbz, 'r') as zf:
+            zf.extractall(config.DOWNLOAD_FOLDER)
+            # uncompressed size - bytes written to disk
+            metrics.read(nbytes=sum(xx.file_size for xx in zf.infolist()))
+    return dbf
+
+
+def remove_state(st: str) -> None:
+    """Deletes geodatabase and zip of loaded state"""
+    dbz = os.path.join(config.DOWNLOAD_FOLDER, f'gSSURGO_{st}.zip')
+    dbf = os.path.join(config.DOWNLOAD_FOLDER, f'gSSURGO_{st}.gdb')
+    if os.path.isdir(dbf):
+        shutil.rmtree(dbf)  # delete gdb
+    if os.path.isfile(dbz):
+        os.remove(dbz)  # delete zip
+
+
+def load_state(dbf: str, st: str, stage: bool = False) -> None:
+    """
+    Loads all layers of state geodatabase - to ssurgo tables (with
+    de-duplication) or to staging tables of state (stage=True)
+    """
+    with metrics.measure(st, 'mupolygon'):
+        load_mupolygon(dbf, st, stage)
+    with metrics.measure(st, 'sapolygon'):
+        load_sapolygon(dbf, st, stage)
+    with metrics.measure(st, 'aggreg'):
+        load_aggreg(dbf, st, stage)
+    with metrics.measure(st, 'tables'):
+        load_tables(dbf, st, stage)
+    if st == 'IA':
+        with metrics.measure(st, 'csr2'):
+            df = process_csr2(dbf)
+            metrics.written(
+                db.bulk_load(df, **destination('aggreg_ia', st, stage))
+            )
+        utils.log_event(f'uploaded csr2 table - {st}', state=st,
+                        stage='csr2', rows=df.shape[0])
+    if st == 'IL':
+        with metrics.measure(st, 'pi'):
+            df = process_pi(dbf)
+            metrics.written(
+                db.bulk_load(df, **destination('aggreg_pi', st, stage))
+            )
+        utils.log_event(f'uploaded pi values to table - {st}', state=st,
+                        stage='pi', rows=df.shape[0])
+
+
+def drop_staged(session, st: str) -> None:
+    for tab in MERGE_TABLES:
+        name = destination(tab, st, True)['name']
+        session.execute(sa.text(f'DROP TABLE IF EXISTS {STAGE_SCHEMA}.{name}'))
+
+
+def create_staged(session, st: str) -> None:
+    """
+    Staging tables of state - unlogged copies of ssurgo tables without
+    constraints, so rows are loaded without de-duplication
+    """
+    for tab in MERGE_TABLES:
+        name = destination(tab, st, True)['name']
+        session.execute(sa.text(
+            f'CREATE UNLOGGED TABLE {STAGE_SCHEMA}.{name} '
+            f'(LIKE ssurgo.{tab} INCLUDING DEFAULTS)'
+        ))
+
+
+def stage_state(st: str) -> tuple:
+    """
+    Worker of parallel import - extracts state geodatabase and loads it to
+    staging tables, returns (state, staged, survey areas extent)
+    """
+    try:
+        dbf = extract_state(st)
+        if dbf is None:
+            return st, False, None
         with db.sync_session() as session:
-            eng = session.get_bind()
-            ukey = pd.read_sql_query(f'select mukey from ssurgo.{tab}',
-                                     con=eng)
-        ukey = ukey.mukey.values
+            drop_staged(session, st)  # leftovers of interrupted import
+            create_staged(session, st)
+        load_state(dbf, st, stage=True)
+        bounds = state_bounds(dbf)
+        if os.path.isdir(dbf):
+            shutil.rmtree(dbf)  # delete gdb, zip is removed after merge
+        utils.log_event(f'staged state - {st}', state=st, stage='stage')
+        return st, True, bounds
+    except Exception as e:
+        utils.log_event(f'Failed to stage state - {st}: {e}'[:254], 'ERROR')
+        return st, False, None
+
+
+def merge_state(st: str) -> None:
+    """
+    Moves staged layers of state to ssurgo tables skipping survey areas and
+    mukeys which are already loaded, in one transaction. Merges are run one
+    at a time, so de-duplication works as in sequential import
+    """
+    counts = []
+    with metrics.measure(st, 'merge'), db.sync_session() as session:
+        for tab in MERGE_TABLES:
+            name = destination(tab, st, True)['name']
+            cols = session.execute(sa.text(
+                'select column_name from information_schema.columns '
+                'where table_schema = :schema and table_name = :name '
+                'order by ordinal_position'
+            ), {'schema': STAGE_SCHEMA, 'name': name}).scalars().all()
+            key_tab, key = dedup_key(tab)
+            dedup = f'SELECT 1 FROM ssurgo.{key_tab} AS t ' \
+                f'WHERE t.{key} = s.{key}'
+            cols = ', '.join(f'"{xx}"' for xx in cols)
+            res = session.execute(sa.text(f'''
+                INSERT INTO ssurgo.{tab} ({cols})
+                SELECT {cols}
+                FROM {STAGE_SCHEMA}.{name} AS s
+                WHERE NOT EXISTS ({dedup})
+                ON CONFLICT DO NOTHING
+            '''))
+            counts.append(f'{tab} {res.rowcount}')
+            metrics.written(res.rowcount)
+        drop_staged(session, st)
+    utils.log_event(f'merged state - {st}: {", ".join(counts)}'[:254],
+                    state=st, stage='merge')
+
+
+def load_queue(load_q: queue.Queue, count: int,
+               slots: threading.Semaphore) -> dict:
+    """
+    Loads extracted states (state, gdb path) from queue one by one directly
+    to ssurgo tables, files of state are removed and disk slot is released
+    after load. Returns survey areas extent of loaded states
+    """
+    loaded = {}
+    for _ in range(count):
+        st, dbf = load_q.get()
+        try:
+            if dbf is not None:
+                load_state(dbf, st)
+                loaded[st] = state_bounds(dbf)
+                utils.log_event(f'loaded state - {st}')
+        except Exception as e:
+            utils.log_event(f'Failed to load state - {st}: {e}'[:254], 'ERROR')
+        finally:
+            remove_state(st)
+            slots.release()
+    return loaded
+
+
+def load_queue_parallel(load_q: queue.Queue, order: list, processes: int,
+                        slots: threading.Semaphore) -> dict:
+    """
+    Extracted states from queue are loaded to staging tables by pool of
+    processes, staged states are merged one by one in this process in order
+    of states list (see stage_state, merge_state) - survey areas shared by
+    states go to the same state as in sequential import, regardless of which
+    one was staged first. Killed worker (ie out of memory) breaks the pool,
+    next states are staged by new pool and states of broken pool are staged
+    again, one at a time. Returns survey areas extent of merged states
+    """
+    loaded = {}
+    with db.sync_session() as session:
+        session.execute(sa.text(f'CREATE SCHEMA IF NOT EXISTS {STAGE_SCHEMA}'))
+    merge_q = queue.Queue()
+    # workers are spawned, not forked - download threads are running. One
+    # state per worker process (python 3.11+), memory of geodatabase reads is
+    # freed
+    ctx = get_context('spawn')
+    kwargs = {'max_tasks_per_child': 1} if sys.version_info >= (3, 11) else {}
+    pools = [ProcessPoolExecutor(processes, mp_context=ctx, **kwargs)]
+    lock = threading.Lock()
+    retry_q = queue.Queue()
+
+    def submit(st: str) -> None:
+        with lock:
+            try:
+                future = pools[-1].submit(stage_state, st)
+            except BrokenProcessPool:
+                pools.append(
+                    ProcessPoolExecutor(processes, mp_context=ctx, **kwargs)
+                )
+                future = pools[-1].submit(stage_state, st)
+        future.add_done_callback(lambda ft: staged(st, ft))
+
+    def staged(st: str, future, retried: bool = False) -> None:
+        try:
+            merge_q.put(future.result())
+        except Exception as e:
+            if isinstance(e, BrokenProcessPool) and not retried:
+                retry_q.put(st)
+                return
+            utils.log_event(
+                f'Failed to stage state - {st}: {e!r}'[:254], 'ERROR'
+            )
+            merge_q.put((st, False, None))
+
+    def retry() -> None:
+        # states of broken pool are staged again one by one, each in its own
+        # process - worker which broke the pool does not fail other states
+        for st in iter(retry_q.get, None):
+            utils.log_event(f'staging state again - {st}', state=st)
+            with ProcessPoolExecutor(1, mp_context=ctx) as pool:
+                staged(st, pool.submit(stage_state, st), True)
+
+    def dispatch() -> None:
+        for _ in order:
+            st, dbf = load_q.get()
+            if dbf is None:
+                merge_q.put((st, False, None))
+            else:
+                submit(st)
+
+    threading.Thread(target=dispatch, daemon=True).start()
+    threading.Thread(target=retry, daemon=True).start()
+    ready = {}
+    try:
+        for st in order:
+            while st not in ready:
+                res = merge_q.get()
+                ready[res[0]] = res
+            _, is_staged, bounds = ready.pop(st)
+            try:
+                if is_staged:
+                    merge_state(st)
+                    loaded[st] = bounds
+            except Exception as e:
+                utils.log_event(
+                    f'Failed to merge state - {st}: {e}'[:254], 'ERROR'
+                )
+            finally:
+                remove_state(st)
+                slots.release()
+    finally:
+        retry_q.put(None)
+        for pool in pools:
+            pool.shutdown()
+    return loaded
+
+
+def load_scheduled_ssurgo(states: list, processes: int = 1,
+                          budget: int = config.DISK_BUDGET_STATES) -> dict:
+    """
+    Overlapped import - every state is downloaded (thread pool), extracted
+    (one thread) and loaded as soon as previous stage is done for it, stages
+    are connected by queues. At most budget states (zip and gdb) are on
+    disk at once - next download starts when loaded state is removed.
+    Loading is sequential (processes=1) or done by pool of processes to
+    staging tables with serialized merge. Returns survey areas extent of
+    loaded states
+    """
+    if config.ZIP_MIRROR_URL:
+        # zips are read from mirror, there is nothing to download
+        files = [[f'gSSURGO_{st}.zip', None, None] for st in states]
+    else:
+        files = list_ssurgo(states)
+    if files is None:
+        return {}
+    slots = threading.BoundedSemaphore(budget)
+    extract_q = queue.Queue()
+    load_q = queue.Queue()
+    utils.log_event(
+        f'import of {len(files)} states, {budget} on disk, {processes} '
+        'loading processes, [START]'
+    )
+
+    def download(fl: list) -> None:
+        st = file_state(fl)
+        try:
+            if not config.ZIP_MIRROR_URL:
+                with metrics.measure(st, 'download'):
+                    download_file(fl)
+                    metrics.read(nbytes=os.path.getsize(
+                        os.path.join(config.DOWNLOAD_FOLDER, fl[0])
+                    ))
+            extract_q.put((st, True))
+        except Exception as e:
+            utils.log_event(
+                f'Failed to download state - {st}: {e}'[:254], 'ERROR'
+            )
+            extract_q.put((st, False))
+
+    def extract() -> None:
+        for _ in files:
+            st, ok = extract_q.get()
+            dbf = None
+            try:
+                dbf = extract_state(st) if ok else None
+            except Exception as e:
+                utils.log_event(
+                    f'Failed to extract state - {st}: {e}'[:254], 'ERROR'
+                )
+            load_q.put((st, dbf))
+
+    with ThreadPoolExecutor(config.DOWNLOAD_WORKERS) as downloads:
 
-        if load_table(dbf, tab, ukey):
-            utils.log_event(f'uploaded {tab} table for state - {state}')
+        def submit() -> None:
+            # disk slots are taken in order of states (released by load
+            # stage), so next state merged by parallel import is never
+            # waiting for slot held by states merged after it
+            for fl in files:
+                slots.acquire()
+                downloads.submit(download, fl)
+
+        submitter = threading.Thread(target=submit, daemon=True)
+        submitter.start()
+        extractor = threading.Thread(target=extract, daemon=True)
+        extractor.start()
+        if processes > 1:
+            loaded = load_queue_parallel(
+                load_q, [file_state(fl) for fl in files], processes, slots
+            )
         else:
-            utils.log_event(f'ERROR uploading {tab} table for state - {state}',
-                            ltype='ERROR')
+            loaded = load_queue(load_q, len(files), slots)
+        submitter.join()
+        extractor.join()
+    utils.log_event('import, [END]')
+    return loaded
 
 
-def load_complete_ssurgo() -> None:
+def load_complete_ssurgo(states: list = None,
+                         processes: int = config.IMPORT_PROCESSES) -> None:
+    states = states or config.STATES
+    # metrics of all states and processes are saved under id of this run
+    metrics.start_run()
     if not os.path.isdir(config.DOWNLOAD_FOLDER):
         os.mkdir(config.DOWNLOAD_FOLDER)
+    with db.sync_session() as session:
+        run_db_script(session, 'import_keys.sql')
     utils.log_event('Start downloading SSURGO databases')
-    download_ssurgo()  # download all states at once
-    for st in config.STATES:
-        dbz = os.path.join(config.DOWNLOAD_FOLDER, f'gSSURGO_{st}.zip')
-        dbf = os.path.join(config.DOWNLOAD_FOLDER, f'gSSURGO_{st}.gdb')
-        if not os.path.isdir(dbf):
-            if not os.path.isfile(dbz):
-                utils.log_event(f'Didn\'t find zip SSURGO for state: {st}')
-                continue
-            with ZipFile(dbz, 'r') as zf:
-                zf.extractall(config.DOWNLOAD_FOLDER)
-        load_mupolygon(dbf, st)
-        load_sapolygon(dbf)
-        load_aggreg(dbf, st)
-        load_tables(dbf, st)
-        if st == 'IA':
-            df = process_csr2(dbf)
-            with db.sync_session() as session:
-                eng = session.get_bind()
-                df.to_sql(
-                    name='aggreg_ia', con=eng,
-                    schema='ssurgo', if_exists='append', chunksize=400,
-                    index=False
-                )
-                utils.log_event(f'uploaded csr2 table - {st}')
-        if st == 'IL':
-            df = process_pi(dbf)
-            with db.sync_session() as session:
-                eng = session.get_bind()
-                df.to_sql(
-                    name='aggreg_pi', con=eng,
-                    schema='ssurgo', if_exists='append', chunksize=400,
-                    index=False
-                )
-                utils.log_event(f'uploaded pi values to table - {st}')
-        shutil.rmtree(dbf)  # delete gdb
-        os.remove(dbz)  # delete zip
+    # states are loaded while next ones are downloaded
+    loaded = load_scheduled_ssurgo(states, processes)
+    optimize_mupolygon()
+    refresh_poly_aggreg()
+    # tiles are rendered from poly_aggreg_mat - cached tiles of loaded states
+    # are dropped only when view has new data, otherwise tiles requested
+    # during import would be cached again from old view
+    for st, bounds in loaded.items():
+        invalidate_tiles(bounds, st)
 
 
 if __name__ == '__main__':
-    load_complete_ssurgo()
+    parser = argparse.ArgumentParser(
+        description='Download and import gSSURGO state geodatabases'
+    )
+    parser.add_argument(
+        'states', nargs='*', default=config.STATES,
+        help='state codes (ie IA IL), all states by default'
+    )
+    parser.add_argument(
+        '--processes', type=int, default=config.IMPORT_PROCESSES,
+        help='states imported concurrently, 1 - sequential import'
+    )
+    parser.add_argument(
+        '--cluster', action='store_true',
+        help='only reorder mupolygon tables on disk (maintenance, no import)'
+    )
+    args = parser.parse_args()
+
+    if args.cluster:
+        cluster_mupolygon()
+    else:
+        load_complete_ssurgo(
+            [xx.upper() for xx in args.states], args.processes
+        )
 
 #   # this is example how to deploy only few states, if You need entire
 #    # dataset simply run load_complete_ssurgo() - all USA will be processed
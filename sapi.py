@@ -1,44 +1,103 @@
 from flask import Flask
 from flask import jsonify
+from flask import Response, request, stream_with_context
 import pandas as pd
 import geopandas as gpd
 import json
+import sqlalchemy as sa
 from shapely.wkt import loads
 from urllib.parse import unquote
 
-from soil_scripts import db
+from soil_scripts import (
+    config, db, features, formats, summary, tiles, tilecache
+)
 
+try:
+    from uwsgidecorators import postfork
+except ImportError:  # running without uWSGI (flask dev server)
+    postfork = None
 
-EMPTY = '{"type": "FeatureCollection", "crs": { "type": "name", "properties": { "name": "urn:ogc:def:crs:EPSG::3857" } }, "features": []}'
 
+EMPTY = '{"type": "FeatureCollection", "crs": { "type": "name", "properties": { "name": "urn:ogc:def:crs:EPSG::3857" } }, "features": []}'
 
-def get_features_bbox(bounds: list = []):
-    sql = 'select * from ssurgo.poly_aggreg where ' + \
-        'ST_Intersects(geometry, ST_MakeEnvelope(' + \
-        ', '.join(map(str, bounds)) + ', 4326));'
 
+def read_features(sql: str, params: dict) -> gpd.GeoDataFrame:
     with db.sync_session() as session:
         eng = session.get_bind()
         try:
-            gdf = gpd.read_postgis(sql, con=eng, crs=4326, geom_col='geometry')
+            gdf = gpd.read_postgis(
+                sa.text(sql), con=eng, crs=4326, geom_col='geometry',
+                params=params
+            )
         except Exception:
-            gdf = gpd.GeoDataFrame()
-    del gdf['id']
+            gdf = gpd.GeoDataFrame(geometry=[], crs=4326)
     return gdf
 
 
+def generalization(bounds: list) -> dict:
+    """
+    Reads tolerance (meters), zoom and precision (decimal digits) from query
+    parameters, raises ValueError on wrong values
+    """
+    tolerance = request.args.get('tolerance', type=float)
+    zoom = request.args.get('zoom', type=int)
+    precision = request.args.get('precision', type=int)
+    if (tolerance is not None and tolerance < 0) or \
+            (zoom is not None and not 0 <= zoom <= 24) or \
+            (precision is not None and
+             not config.PRECISION_MIN <= precision <= 9):
+        raise ValueError('Wrong tolerance, zoom or precision value')
+    return features.generalization(bounds, tolerance, zoom, precision)
+
+
+def features_response(sql: str, params: dict) -> Response:
+    """
+    Returns features in format chosen by ?f= or Accept header. GeoJSON
+    FeatureCollection and NDJSON are encoded in db and streamed in chunks,
+    GeoParquet, Arrow IPC and FlatGeobuf are built from WKB geometries
+    """
+    try:
+        fmt = formats.negotiate(
+            request.args.get('f'), request.accept_mimetypes
+        )
+    except formats.FormatError as e:
+        return jsonify({'error': str(e)}), 406
+
+    if fmt in formats.STREAMED:
+        return Response(
+            stream_with_context(features.stream_geojson(sql, params, fmt)),
+            mimetype=formats.FORMATS[fmt],
+        )
+
+    try:
+        data = formats.encode(read_features(sql, params), fmt)
+    except formats.FormatError as e:
+        return jsonify({'error': str(e)}), 406
+    if not data:
+        return Response(status=204)
+    return Response(data, mimetype=formats.FORMATS[fmt])
+
+
 app = Flask(__name__)
 
+if postfork is not None:
+    # workers are forked from master, do not share its db connections
+    postfork(db.dispose_sync_engine)
+
 
 @app.route("/get-features-bbox/<xmin>,<ymin>,<xmax>,<ymax>")
 def get_bbox(xmin, ymin, xmax, ymax):
-    gdf = get_features_bbox([xmin, ymin, xmax, ymax])
-    if gdf.shape[0] == 0:
+    try:
+        bounds = [float(xx) for xx in (xmin, ymin, xmax, ymax)]
+    except ValueError:
         return jsonify(json.loads(EMPTY))
-
-    js = gdf.to_json()
-    js = json.loads(js)
-    return jsonify(js)
+    try:
+        gen = generalization(bounds)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    params = dict(zip(['xmin', 'ymin', 'xmax', 'ymax'], bounds))
+    params.update(features.generalization_params(gen))
+    return features_response(features.bbox_sql(gen), params)
 
 
 @app.route("/get-features-poly/<poly>")
@@ -49,21 +108,99 @@ def get_poly(poly):
     except Exception:
         return jsonify(json.loads(EMPTY))
 
-    gdf = get_features_bbox(poly.bounds)
-    gdf = gdf.to_crs(5070)
-    gdf['total_area'] = gdf.area
-    gdf = gdf.to_crs(4326)
-    gdf = gdf.clip(poly)
-    if gdf.shape[0] == 0:
-        return jsonify(json.loads(EMPTY))
-    gdf = gdf.to_crs(5070)
-    gdf['area_AOI'] = gdf.area
-    gdf['area_perc'] = (gdf.area_AOI/gdf.area.sum()) * 100
-    gdf = gdf.to_crs(4326)
+    try:
+        gen = generalization(poly.bounds)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    params = {'wkt': poly.wkt}
+    params.update(features.generalization_params(gen))
+    return features_response(features.poly_sql(gen), params)
+
+
+@app.route("/summary-poly", methods=['POST'])
+def summary_poly():
+    """
+    returns areas and attributes per mukey for AOI posted as WKT or GeoJSON,
+    without geometries
+    """
+    aoi = summary.read_geometry(request.get_data(as_text=True))
+    if aoi is None or aoi.is_empty:
+        return jsonify({'error': 'AOI should be WKT or GeoJSON polygon'}), 400
+    return jsonify(summary.get_summary(aoi))
+
+
+BATCH_FORMATS = {
+    'parquet': 'parquet',
+    'geoparquet': 'parquet',
+    'application/vnd.apache.parquet': 'parquet',
+    'application/x-parquet': 'parquet',
+    'ndjson': 'ndjson',
+    'geojsonl': 'ndjson',
+    'geojsons': 'ndjson',
+    'application/x-ndjson': 'ndjson',
+    'application/geo+json-seq': 'ndjson',
+}
+
+
+@app.route("/summary-batch", methods=['POST'])
+def summary_batch():
+    """
+    returns summaries (like /summary-poly) for many AOIs posted as GeoJSON
+    FeatureCollection, NDJSON features or GeoParquet (body or 'file' upload),
+    results are streamed as NDJSON - one line per AOI with its id
+    """
+    upload = request.files.get('file')
+    if upload is not None:
+        data = upload.read()
+        fmt = upload.filename.rsplit('.', 1)[-1].lower()
+    else:
+        data = request.get_data()
+        fmt = request.mimetype
+    fmt = BATCH_FORMATS.get(request.args.get('format', fmt), 'geojson')
 
-    js = gdf.to_json()
-    js = json.loads(js)
-    return jsonify(js)
+    try:
+        aois = summary.read_aois(data, fmt, request.args.get('id_field'))
+    except summary.AoiError as e:
+        return jsonify({'error': str(e)}), 400
+
+    def generate():
+        for line in summary.batch_summary(aois):
+            yield line + '\n'
+
+    return Response(
+        stream_with_context(generate()), mimetype='application/x-ndjson'
+    )
+
+
+@app.route("/tiles/<int:z>/<int:x>/<int:y>.mvt")
+def get_tile(z, x, y):
+    """
+    returns Mapbox Vector Tile, layers (and their attributes) can be selected
+    by ?layers=mapunit,ratings:csr2;cpi
+    """
+    if not tiles.valid_tile(z, x, y):
+        return Response(status=404)
+    layers = tiles.parse_layers(request.args.get('layers'))
+    if not layers:
+        return Response(status=400)
+
+    cached = tilecache.get(z, x, y, layers)
+    if cached is None:
+        tile = tiles.get_tile(z, x, y, layers)
+        etag = tilecache.put(z, x, y, layers, tile)
+    else:
+        tile, etag = cached
+
+    if request.if_none_match.contains(etag):
+        resp = Response(status=304)
+    elif not tile:
+        resp = Response(status=204)
+    else:
+        resp = Response(tile, mimetype='application/vnd.mapbox-vector-tile')
+    resp.set_etag(etag)
+    resp.cache_control.public = True
+    resp.cache_control.max_age = config.TILE_CACHE_MAX_AGE
+    return resp
 
 
 @app.route("/get-components-by-mukey/<muks>")
@@ -97,9 +234,7 @@ def get_components(muks):
         except Exception:
             df = pd.DataFrame()
 
-    js = df.to_json()
-    js = json.loads(js)
-    return jsonify(js)
+    return Response(df.to_json(), mimetype='application/json')
 
 
 if __name__ == "__main__":
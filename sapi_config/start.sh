@@ -1,3 +1,5 @@
 #!/usr/bin/env bash
+# cache folder is mounted from host, uwsgi workers run as www-data
+mkdir -p cache && chown -R www-data:www-data cache
 service nginx start
 uwsgi --ini uwsgi.ini
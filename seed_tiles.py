@@ -0,0 +1,135 @@
+import argparse
+from multiprocessing import Pool
+
+import geopandas as gpd
+from shapely.geometry import box
+from shapely.prepared import prep
+
+from soil_scripts import config, db, tilecache, tiles, utils
+
+# survey area symbols starts with state code, except territories packed
+# together in one geodatabase
+STATE_PREFIXES = {
+    'PRUSVI': ['PR', 'VI'],
+}
+BATCH = 200  # tiles written to cache in one transaction
+
+
+def state_areas(state: str) -> gpd.GeoDataFrame:
+    """Returns survey area polygons (ssurgo.sapolygon) of state"""
+    prefixes = STATE_PREFIXES.get(state, [state])
+    sql = (
+        'select areasymbol, geometry from ssurgo.sapolygon '
+        'where left(areasymbol, 2) in (' +
+        ', '.join(f"'{xx}'" for xx in prefixes if xx.isalpha()) + ');'
+    )
+    with db.sync_session() as session:
+        eng = session.get_bind()
+        return gpd.read_postgis(sql, con=eng, crs=4326, geom_col='geometry')
+
+
+def state_tiles(state: str, minzoom: int, maxzoom: int) -> list:
+    """
+    Enumerates tiles intersecting survey areas of state. Tiles are searched
+    from minzoom, only children of intersecting tiles are checked on next zoom
+    """
+    gdf = state_areas(state)
+    if gdf.shape[0] == 0:
+        return []
+    geom = gdf.geometry.unary_union
+    pgeom = prep(geom)
+
+    xmin, ymin, xmax, ymax = tilecache.tile_range(list(geom.bounds), minzoom)
+    level = [
+        (minzoom, x, y)
+        for x in range(xmin, xmax + 1) for y in range(ymin, ymax + 1)
+    ]
+    out = []
+    for z in range(minzoom, maxzoom + 1):
+        level = [
+            tl for tl in level
+            if pgeom.intersects(box(*tilecache.tile_bounds(*tl)))
+        ]
+        out += level
+        level = [
+            (z + 1, x * 2 + dx, y * 2 + dy)
+            for _, x, y in level for dx in (0, 1) for dy in (0, 1)
+        ]
+    return out
+
+
+def render_tile(args: tuple) -> tuple:
+    z, x, y, layers = args
+    return z, x, y, tiles.get_tile(z, x, y, layers)
+
+
+def seed_state(state: str, minzoom: int, maxzoom: int, layers: dict,
+               processes: int, force: bool = False) -> None:
+    todo = state_tiles(state, minzoom, maxzoom)
+    if not force:
+        todo = [
+            tl for tl in todo if tilecache.get(*tl, layers) is None
+        ]
+    utils.log_event(
+        f'seeding {len(todo)} tiles [z{minzoom}-z{maxzoom}] for state - '
+        f'{state}, [START]'
+    )
+    done = 0
+    batch = []
+    with Pool(processes) as pool:
+        for res in pool.imap_unordered(
+            render_tile, [(*tl, layers) for tl in todo], chunksize=8
+        ):
+            batch.append(res)
+            if len(batch) >= BATCH:
+                tilecache.put_many(layers, batch)
+                done += len(batch)
+                batch = []
+                if done % (BATCH * 50) == 0:
+                    utils.log_event(
+                        f'seeded {done}/{len(todo)} tiles for state - {state}'
+                    )
+    tilecache.put_many(layers, batch)
+    done += len(batch)
+    utils.log_event(f'seeded {done} tiles for state - {state}, [END]')
+
+
+def seed_tiles(states: list, minzoom: int, maxzoom: int, layers: dict,
+               processes: int, force: bool = False) -> None:
+    for st in states:
+        try:
+            seed_state(st, minzoom, maxzoom, layers, processes, force)
+        except Exception as e:
+            utils.log_event(
+                f'Failed to seed tiles for state - {st}: {e}'[:254], 'ERROR'
+            )
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(
+        description='Pre-render vector tiles of imported states to tile cache'
+    )
+    parser.add_argument(
+        'states', nargs='*', default=config.STATES,
+        help='state codes (ie IA IL), all states by default'
+    )
+    parser.add_argument('--minzoom', type=int, default=config.TILE_MIN_ZOOM)
+    parser.add_argument('--maxzoom', type=int, default=14)
+    parser.add_argument(
+        '--layers', default=None,
+        help='layers like in /tiles endpoint, ie mapunit,ratings:csr2;cpi'
+    )
+    parser.add_argument('--processes', type=int, default=4)
+    parser.add_argument(
+        '--force', action='store_true', help='render already cached tiles'
+    )
+    args = parser.parse_args()
+
+    seed_tiles(
+        [xx.upper() for xx in args.states],
+        max(args.minzoom, config.TILE_MIN_ZOOM),
+        args.maxzoom,
+        tiles.parse_layers(args.layers),
+        args.processes,
+        args.force,
+    )
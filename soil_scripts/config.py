@@ -7,12 +7,117 @@ DOWNLOAD_FOLDER = BASEDIR.joinpath("download")
 if not os.path.isdir(DOWNLOAD_FOLDER):
     os.mkdir(DOWNLOAD_FOLDER)
 
+# SSURGO downloads (Box shared folder), urls can point to local mirror
+DOWNLOAD_LIST_URL = os.getenv(
+    "DOWNLOAD_LIST_URL",
+    "https://nrcs.app.box.com/v/soils/folder/180112652169?page={}"
+)
+DOWNLOAD_URL = os.getenv(
+    "DOWNLOAD_URL",
+    "https://nrcs.app.box.com/index.php"
+    "?rm=box_download_shared_file&vanity_name=soils&file_id={file_id}"
+)
+DOWNLOAD_WORKERS = int(os.getenv("DOWNLOAD_WORKERS", "4"))
+DOWNLOAD_CHUNK = 1024 * 1024
+DOWNLOAD_RETRIES = int(os.getenv("DOWNLOAD_RETRIES", "5"))
+DOWNLOAD_BACKOFF = 2  # seconds, doubled on every retry
+DOWNLOAD_VERIFY_CRC = os.getenv("DOWNLOAD_VERIFY_CRC", "1") == "1"
+# geodatabase layers are read straight from downloaded zip (GDAL /vsizip/)
+# instead of extracting it to DOWNLOAD_FOLDER
+READ_FROM_ZIP = os.getenv("READ_FROM_ZIP", "0") == "1"
+# url of zips mirror with {state} placeholder
+# (ie https://mirror/gSSURGO_{state}.zip), zips are read over http
+# (/vsicurl/) and not downloaded at all, Box folder is not used
+ZIP_MIRROR_URL = os.getenv("ZIP_MIRROR_URL", "")
+
 DATABASE_USERNAME = os.getenv("DATABASE_USERNAME", "postgres")
 DATABASE_PASSWORD = os.getenv("DATABASE_PASSWORD", "postgres")
 DATABASE_HOST = os.getenv("DATABASE_HOST", "localhost")
 DATABASE_PORT = os.getenv("DATABASE_PORT", "5432")
 DATABASE_NAME = os.getenv("DATABASE_NAME", "soil_data")
 
+# sync engine pool, one pool per process (uWSGI workers, import processes)
+DATABASE_POOL_SIZE = int(os.getenv("DATABASE_POOL_SIZE", "5"))
+DATABASE_MAX_OVERFLOW = int(os.getenv("DATABASE_MAX_OVERFLOW", "10"))
+DATABASE_POOL_RECYCLE = int(os.getenv("DATABASE_POOL_RECYCLE", "1800"))
+# import log (importlog.DbLogHandler) - records are inserted to
+# ssurgo.importlog in batches by background thread
+LOG_BATCH_SIZE = 500
+LOG_FLUSH_SECONDS = float(os.getenv("LOG_FLUSH_SECONDS", "2"))
+LOG_QUEUE_SIZE = 100000
+# rows sent in one COPY command by db.bulk_load
+COPY_CHUNK = 50000
+# features read from geodatabase layer at once (reader.iter_batches)
+READ_BATCH_SIZE = int(os.getenv("READ_BATCH_SIZE", "50000"))
+
+# vector tiles (/tiles/<z>/<x>/<y>.mvt), below TILE_MIN_ZOOM empty tiles are
+# returned - one tile would cover entire states
+TILE_MIN_ZOOM = int(os.getenv("TILE_MIN_ZOOM", "8"))
+TILE_EXTENT = 4096
+TILE_BUFFER = 64
+# simplification tolerance in tile grid cells, not used from max zoom
+TILE_SIMPLIFY_PX = 1
+TILE_SIMPLIFY_MAX_ZOOM = 16
+# layers in tile with attributes (columns of ssurgo.poly_aggreg_mat)
+TILE_LAYERS = {
+    'mapunit': ['mukey', 'musym', 'muname', 'state'],
+    'ratings': [
+        'mukey',
+        'csr',
+        'csr2',
+        'pi',
+        'cpi',
+        'di',
+        'pi_forest',
+        'soil_index_base',
+        'nccpi3corn',
+        'nccpi3soy',
+        'nccpi3cot',
+        'nccpi3sg',
+        'nccpi3all',
+    ],
+}
+
+# simplified geometry columns of ssurgo.poly_aggreg_mat with their
+# tolerance in meters, used when requested simplification is coarser
+GEOM_LEVELS = {
+    'geom_10': 10,
+    'geom_100': 100,
+}
+
+# intersection tests of api are done on ssurgo.mupolygon_subdiv pieces
+# (max SUBDIVIDE_VERTICES vertices), built after import
+USE_SUBDIVIDED = os.getenv("USE_SUBDIVIDED", "1") == "1"
+SUBDIVIDE_VERTICES = 256
+
+# default simplification of features endpoints - tolerance is bbox size
+# divided by SIMPLIFY_PIXELS, coordinates are never rounded below
+# PRECISION_MIN decimal digits
+SIMPLIFY_PIXELS = 4096
+PRECISION_MIN = 4
+
+# attributes returned by /summary-poly, averaged by area of mukeys in AOI
+SUMMARY_ATTRS = [
+    'csr',
+    'csr2',
+    'nccpi3all',
+    'cpi',
+    'pi',
+]
+
+# /summary-batch limits, AOIs are inserted to temporary table in chunks
+BATCH_MAX_AOIS = int(os.getenv("BATCH_MAX_AOIS", "50000"))
+BATCH_INSERT_SIZE = 5000
+
+# tile cache (sqlite file), bump TILE_CACHE_VERSION after loading new SSURGO
+# release to drop all previously cached tiles
+TILE_CACHE = os.getenv("TILE_CACHE", "1") == "1"
+TILE_CACHE_PATH = os.getenv(
+    "TILE_CACHE_PATH", str(BASEDIR.joinpath("cache", "tiles.sqlite"))
+)
+TILE_CACHE_VERSION = os.getenv("TILE_CACHE_VERSION", "1")
+TILE_CACHE_MAX_AGE = int(os.getenv("TILE_CACHE_MAX_AGE", "86400"))
+
 # Keep in mind, all table here are filtered by mukey column values, so if
 # chorizon table needs to be imported it shouldn't be pointed to porcess here,
 # but instead separate import should be used
@@ -23,6 +128,21 @@ IMPORT_TABLES = [
     'muaggatt',
 ]
 
+# attributes of ssurgo.aggreg aggregated from components per mukey, weighted
+# by comppct_r - column: (component column, 'sum' or 'mean'), new columns
+# need to be added to ssurgo.aggreg table first
+AGGREG_WEIGHTED = {
+    'cpi': ('cropprodindex', 'sum'),
+}
+
+# states imported concurrently (import_soils.py), every process loads one
+# state to staging tables, 1 - sequential import without staging
+IMPORT_PROCESSES = int(os.getenv("IMPORT_PROCESSES", "1"))
+# states (zip and extracted gdb) kept on disk at once during import, next
+# state is downloaded when loaded one is removed, should be higher than
+# IMPORT_PROCESSES
+DISK_BUDGET_STATES = int(os.getenv("DISK_BUDGET_STATES", "4"))
+
 STATES = [
     'AK',
     'AL',
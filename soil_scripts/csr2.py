@@ -1,3 +1,4 @@
+import numpy as np
 import pandas as pd
 import geopandas as gpd
 
@@ -227,35 +228,231 @@ def calc_csr2(mukey: str = '409089', **kwargs) -> int:
     return round(5 if sum_csr2 < 5 else sum_csr2)
 
 
-def process_csr2(pth: str) -> pd.DataFrame:
-    # load all needed tables
-    mapunit = gpd.read_file(pth, layer='mapunit', ignore_geometry=True)
-    component = gpd.read_file(pth, layer='component', ignore_geometry=True)
-    agg = gpd.read_file(pth, layer='muaggatt', ignore_geometry=True)
-    comnth = gpd.read_file(pth, layer='comonth', ignore_geometry=True)
-    cho = gpd.read_file(pth, layer='chorizon', ignore_geometry=True)
-
-    # dict needs to be updated from agg table
-    dct_ej_add.update(
-        {xx: 10 for xx in agg[agg['musym'] == '221B'].mukey.values}
+def _contains(col: pd.Series, txt: str) -> pd.Series:
+    return col.astype(str).str.contains(txt, regex=False)
+
+
+def _numeric(col: pd.Series) -> pd.Series:
+    """
+    Values which pass float(val) as numbers, others (None, text) as NaN -
+    marked in second series as failed
+    """
+    num = pd.to_numeric(col, errors='coerce')
+    if pd.api.types.is_numeric_dtype(col):
+        return num, pd.Series(False, index=col.index)
+    return num, num.isna() & ~col.map(lambda xx: isinstance(xx, float))
+
+
+def csr2_factors(component: pd.DataFrame, comnth: pd.DataFrame,
+                 cho: pd.DataFrame, ej_add: dict = None) -> pd.DataFrame:
+    """
+    All factors (s, m, w, d, f, ej) and csr2 for components of all mukeys at
+    once, same rules as calc_csr2 and calc_* functions (rows of components
+    with taxsubgrp in DCT_SFAC and with chorizons)
+    """
+    ej_add = dct_ej_add if ej_add is None else ej_add
+    sin = component[[
+        'mukey',
+        'cokey',
+        'majcompflag',
+        'comppct_r',
+        'compname',
+        'localphase',
+        'taxsubgrp',
+        'taxpartsize',
+        'tfact',
+        'slope_r',
+        'erocl',
+    ]].copy()
+    sin['s_fact'] = sin.taxsubgrp.map(dct_sfac)
+    sin = sin[sin.s_fact.notna()]
+
+    # m factor
+    part = sin.taxpartsize.fillna('').astype(str)
+    mfac = part.map(dct_mfac)
+    sin['m_fact'] = np.where(
+        mfac.isna() & _contains(part, 'skeletal'),
+        12,
+        mfac.fillna(0) + 5 * _contains(part, 'calcareous')
+    )
+
+    # w factor - water holding capacity of chorizons
+    chos = cho[cho.cokey.isin(sin.cokey)]
+    chocalc = pd.DataFrame({
+        'cokey': chos.cokey,
+        'dpth': chos.hzdepb_r - chos.hzdept_r,
+        'cwhc': (chos.hzdepb_r - chos.hzdept_r) * chos.awc_r,
+    }).groupby('cokey').agg({'dpth': 'sum', 'cwhc': 'sum'})
+    sin = sin.merge(chocalc, on='cokey', how='left')
+    sin = sin.dropna(subset=['cwhc'])  # drop components without water
+    sin['w_fact'] = np.select(
+        [sin.cwhc < 3.01, sin.cwhc < 6.0, sin.cwhc < 9.0], [24, 12, 8], 0
+    )
+
+    # d factor, tfact out of 1-5 gives NaN (calc_dfactor returns None)
+    tfact, failed = _numeric(sin.tfact)
+    tfact = np.trunc(tfact)
+    sin['d_fact'] = np.select(
+        [
+            _contains(sin.compname, 'Histosols'),
+            failed | tfact.isna(),
+            tfact == 5,
+            tfact == 4,
+            tfact == 3,
+            tfact == 2,
+            tfact == 1,
+        ],
+        [0, 0, 0, 10, 20, 30, 40],
+        np.nan
+    )
+
+    # f factor - May flooding and ponding, slope and erosion
+    coms = comnth[(comnth.cokey.isin(sin.cokey)) & (comnth.month == 'May')]
+    coms = coms[[
+        'flodfreqcl', 'floddurcl', 'pondfreqcl', 'ponddurcl', 'cokey'
+    ]]
+    sin = sin.merge(coms, on='cokey', how='left')
+    freq = sin.flodfreqcl
+    dur = sin.floddurcl
+    sin['f_flood'] = np.select(
+        [
+            (freq == 'Frequent') & (dur == 'Brief (2 to 7 days)'),
+            (freq == 'Frequent') & (dur == 'Very brief (4 to 48 hours)'),
+            (freq == 'Frequent') &
+            (dur == 'Extremely brief (0.1 to 4 hours)'),
+            (freq == 'Occasional') & (dur == 'Brief (2 to 7 days)'),
+            (freq == 'Occasional') & (dur == 'Very brief (4 to 48 hours)'),
+            (freq == 'Occasional') & (dur == 'Long (7 to 30 days)'),
+            (freq == 'Occasional') &
+            (dur == 'Very long (more than 30 days)'),
+            (freq == 'Occasional') &
+            (dur == 'Extremely brief (0.1 to 4 hours)'),
+        ],
+        [20, 10, 5, 6, 4, 10, 34, 2],
+        0
+    )
+    pond = sin.pondfreqcl.isin(['Frequent', 'Occasional'])
+    sin['f_pond'] = np.select(
+        [
+            pond & sin.ponddurcl.isin(
+                ['Brief (2 to 7 days)', 'Very Brief']
+            ),
+            pond & sin.ponddurcl.isin(
+                ['Long (7 to 30 days)', 'Very long (more than 30 days)']
+            ),
+        ],
+        [20, 44],
+        0
     )
+    slope, failed = _numeric(sin.slope_r)
+    sin['slope'] = np.select(
+        [failed, slope < 2, slope < 5, slope < 9], [0, 0, 5, 15], 3 * slope
+    )
+    sin['erosion'] = 40 * _contains(sin.localphase, 'channeled') + \
+        3 * _contains(sin.erocl, 'Class 2')
+    sin['f_fact'] = sin.f_flood + sin.f_pond + sin.slope + sin.erosion
+
+    sin['ej_fact'] = sin.compname.map(dct_ej_subst).fillna(0) - \
+        sin.compname.map(ej_add).fillna(0) - sin.mukey.map(ej_add).fillna(0)
 
-    df = pd.DataFrame(columns=['mukey', 'csr2'])
-    for ii, mukey in enumerate(mapunit.mukey.values):
-        try:
-            val = calc_csr2(mukey, component=component, comnth=comnth, cho=cho)
-            df = pd.concat([
-                df, pd.DataFrame({'mukey': mukey, 'csr2': val}, index=[0])
-            ], ignore_index=True)
-        except Exception:
-            utils.log_event(
-                f'Error calculating CSR2 for mukey: {mukey}', ltype='ERROR'
-            )
-
-        if ii % 500 == 0 and ii > 0:
-            print(f'processed {ii}')
-
-    return df
+    sin['csr2'] = \
+        sin.s_fact-sin.m_fact-sin.w_fact-sin.f_fact-sin.d_fact-sin.ej_fact
+    sin['csr2'] = sin.csr2.mask(sin.csr2 < 5, 5)
+    return sin
+
+
+def calc_csr2_all(component: pd.DataFrame, comnth: pd.DataFrame,
+                  cho: pd.DataFrame, ej_add: dict = None) -> pd.DataFrame:
+    """
+    Vectorized calc_csr2 - returns csr2 (mukey, csr2) for mukeys of
+    component table, the same as from calc_csr2 called for each mukey.
+    mukeys calc_csr2 fails on are skipped as mukeys without components:
+    - taxpartsize of rated component (taxsubgrp in DCT_SFAC) is not text
+      nor None, ie NaN (calc_mfactor fails)
+    - no rated component has chorizons
+    ej_add - DCT_EJ_ADD extended by mukeys (see process_csr2)
+    """
+    mukeys = pd.Series(component.mukey.unique())
+    sin = csr2_factors(component, comnth, cho, ej_add)
+
+    # weighted sum per mukey, summed in the same order as in calc_csr2
+    sin = sin.sort_values('mukey', kind='stable')
+    weight = ((sin.comppct_r / 100) * sin.csr2).fillna(0).values
+    keys, starts = np.unique(sin.mukey.values, return_index=True)
+    sums = pd.Series(
+        np.add.reduceat(weight, starts) if len(starts) else [],
+        index=keys, dtype=float
+    )
+    sums = sums.reindex(mukeys.values).fillna(0)
+    csr2 = np.round(sums.where(sums >= 5, 5))
+
+    # mukeys decided before factors calculation
+    sfac = component.taxsubgrp.map(dct_sfac).notna()
+    comps = component.assign(
+        sfac=sfac,
+        gullied=component.compname.isin(['Gullied Land', 'Urban Land']),
+        wet=(component.nirrcapscl == 'w') & (component.nirrcapcl == 5),
+        bad_part=sfac & ~component.taxpartsize.map(
+            lambda xx: xx is None or isinstance(xx, str)
+        ),
+    ).groupby('mukey').agg(
+        {'sfac': 'any', 'gullied': 'any', 'wet': 'any', 'bad_part': 'any'}
+    )
+    comps = comps.reindex(mukeys.values)
+    csr2 = csr2.mask(~comps.sfac, 5)
+    csr2 = csr2.mask(comps.wet, 25)
+    csr2 = csr2.mask(comps.gullied, 5)
+
+    # mukeys calc_csr2 fails on
+    failed = comps.sfac & ~comps.wet & ~comps.gullied & (
+        comps.bad_part | ~comps.index.isin(keys)
+    )
+    return pd.DataFrame({
+        'mukey': mukeys.values[~failed.values],
+        'csr2': csr2.values[~failed.values].astype(int),
+    })
+
+
+# geodatabase tables used by CSR2 calculation
+CSR2_TABLES = ['mapunit', 'component', 'muaggatt', 'comonth', 'chorizon']
+
+
+def read_csr2_tables(pth: str) -> dict:
+    """Loads all needed tables from geodatabase, as csr2_table kwargs"""
+    return {
+        tab: gpd.read_file(pth, layer=tab, ignore_geometry=True)
+        for tab in CSR2_TABLES
+    }
+
+
+def ej_additions(muaggatt: pd.DataFrame) -> dict:
+    """DCT_EJ_ADD updated by mukeys of 221B map units"""
+    ej_add = dict(dct_ej_add)
+    ej_add.update(
+        {xx: 10 for xx in muaggatt[muaggatt['musym'] == '221B'].mukey.values}
+    )
+    return ej_add
+
+
+def csr2_table(mapunit: pd.DataFrame, component: pd.DataFrame,
+               muaggatt: pd.DataFrame, comonth: pd.DataFrame,
+               chorizon: pd.DataFrame) -> pd.DataFrame:
+    """csr2 (mukey, csr2) for mukeys of mapunit table, in mapunit order"""
+    df = calc_csr2_all(component, comonth, chorizon, ej_additions(muaggatt))
+    missing = ~mapunit.mukey.isin(df.mukey)
+    if missing.any():
+        utils.log_event(
+            f'Cannot calculate CSR2 for {missing.sum()} mukeys (no '
+            f'components or missing data): '
+            f'{", ".join(mapunit.mukey[missing].astype(str).values[:20])}',
+            ltype='ERROR'
+        )
+    # keep order of mapunit table
+    return mapunit[['mukey']].merge(df, on='mukey')
+
+
+def process_csr2(pth: str) -> pd.DataFrame:
+    return csr2_table(**read_csr2_tables(pth))
 
 
 if __name__ == '__main__':
@@ -2,7 +2,7 @@ import os
 import geopandas as gpd
 import pandas as pd
 
-from . import utils
+from . import metrics, utils
 
 # dict to translate county names to Surveyareas
 counties_dct = {
@@ -130,6 +130,7 @@ def process_csr2(pth: str) -> pd.DataFrame:
         )
         if mu.shape[0] == 0:
             break
+        metrics.read(mu)
         allmu = pd.concat([allmu, mu], ignore_index=True)
         # drop duplicate to preserve memory
         allmu = allmu.drop_duplicates(subset=['MUKEY', 'AREASYMBOL'])
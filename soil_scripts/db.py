@@ -1,6 +1,10 @@
+import io
+import os
 from contextlib import contextmanager
 
+import pandas as pd
 import sqlalchemy as sa
+from shapely import wkb
 from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine
 from sqlalchemy.orm import Session, declarative_base, sessionmaker
 
@@ -25,19 +29,65 @@ DbSession = sessionmaker(
 )
 
 
+sync_sqlalchemy_uri = (
+    f"postgresql+psycopg2://{DATABASE_USERNAME}:{DATABASE_PASSWORD}"
+    f"@{DATABASE_HOST}:{DATABASE_PORT}/{DATABASE_NAME}"
+)
+
+# process wide sync engine, created on first use - see get_sync_engine()
+_sync_engine = None
+_sync_engine_pid = None
+SyncSession = sessionmaker()
+
+
 class DbConnectionError(Exception):
     ...
 
 
+def get_sync_engine() -> sa.engine.Engine:
+    """
+    Returns pooled sync engine shared by all sessions in current process.
+    Engine is created lazily, if process was forked (uWSGI workers, process
+    pools) connections inherited from parent are dropped and fresh pool is
+    used in child.
+    """
+    global _sync_engine, _sync_engine_pid
+    if _sync_engine is not None and _sync_engine_pid != os.getpid():
+        dispose_sync_engine()
+    if _sync_engine is None:
+        _sync_engine = sa.create_engine(
+            sync_sqlalchemy_uri,
+            pool_size=config.DATABASE_POOL_SIZE,
+            max_overflow=config.DATABASE_MAX_OVERFLOW,
+            pool_recycle=config.DATABASE_POOL_RECYCLE,
+            pool_pre_ping=True,
+        )
+        _sync_engine_pid = os.getpid()
+        SyncSession.configure(bind=_sync_engine)
+    return _sync_engine
+
+
+def dispose_sync_engine() -> None:
+    """
+    Drops sync engine pool. Call it after fork (uWSGI postfork hook) - sockets
+    inherited from parent process are not closed, only forgotten, so parent
+    connections stay untouched.
+    """
+    global _sync_engine, _sync_engine_pid
+    if _sync_engine is None:
+        return
+    if _sync_engine_pid == os.getpid():
+        _sync_engine.dispose()
+    else:
+        _sync_engine.dispose(close=False)
+    _sync_engine = None
+    _sync_engine_pid = None
+
+
 @contextmanager
 def sync_session() -> Session:
-    sync_sqlalchemy_uri = (
-        f"postgresql+psycopg2://{DATABASE_USERNAME}:{DATABASE_PASSWORD}"
-        f"@{DATABASE_HOST}:{DATABASE_PORT}/{DATABASE_NAME}"
-    )
-    sync_engine = sa.create_engine(sync_sqlalchemy_uri)
-    Session = sessionmaker(bind=sync_engine)
-    session = Session()
+    get_sync_engine()
+    session = SyncSession()
     try:
         yield session
         session.commit()
@@ -46,3 +96,100 @@ def sync_session() -> Session:
         raise DbConnectionError(f"Cannot connect to db: {e}")
     finally:
         session.close()
+
+
+def ewkb_hex(geoms, srid: int = 4326) -> list:
+    """Geometries as hex EWKB (with srid), accepted by PostGIS COPY input"""
+    return [
+        None if geom is None else wkb.dumps(geom, hex=True, srid=srid)
+        for geom in geoms
+    ]
+
+
+def copy_csv(session, df: pd.DataFrame, table: str) -> None:
+    """Streams rows of df to table by COPY FROM STDIN (csv, empty is NULL)"""
+    cols = ', '.join(f'"{xx}"' for xx in df.columns)
+    cursor = session.connection().connection.cursor()
+    for ii in range(0, df.shape[0], config.COPY_CHUNK):
+        buf = io.StringIO()
+        df.iloc[ii:ii+config.COPY_CHUNK].to_csv(buf, index=False, header=False)
+        buf.seek(0)
+        cursor.copy_expert(
+            f'COPY {table} ({cols}) FROM STDIN WITH (FORMAT csv)', buf
+        )
+
+
+def bulk_load(df: pd.DataFrame, name: str, schema: str = 'ssurgo',
+              srid=None, skip: tuple = None) -> int:
+    """
+    Loads DataFrame/GeoDataFrame to existing table (replacement of
+    to_sql/to_postgis). Rows are copied to temporary (not WAL logged) table
+    with column types of target and moved by one
+    INSERT ... SELECT ... ON CONFLICT DO NOTHING, so rows with keys already
+    in table are skipped. Returns number of inserted rows.
+    When srid is given 'geometry' column holds WKB (bytes) in that crs
+    (see reader.iter_batches) - EPSG code or PROJ string of crs without
+    code, geometries are transformed to EPSG:4326 and promoted to multi by
+    db.
+    skip - (table, column) of ssurgo schema, rows with column value already
+    in that table are not inserted (anti-join on indexed key, ie
+    ('sapolygon', 'areasymbol') for mupolygons of loaded survey areas)
+    """
+    if df.shape[0] == 0:
+        return 0
+    # plain DataFrame (geometries are replaced by EWKB text), copied - without
+    # copy=True it shares columns with caller frame, which would be modified
+    df = pd.DataFrame(df, copy=True)
+    for col in df.columns:
+        if df[col].dtype.name == 'geometry':
+            df[col] = ewkb_hex(df[col])
+    if srid is not None:
+        df['geometry'] = [
+            None if geom is None else geom.hex() for geom in df['geometry']
+        ]
+    cols = ', '.join(f'"{xx}"' for xx in df.columns)
+    select = cols
+    params = {}
+    if srid is not None:
+        if isinstance(srid, str):
+            params['from_proj'] = srid
+            transform = 'ST_Transform(geometry, :from_proj, 4326)'
+        else:
+            transform = \
+                f'ST_Transform(ST_SetSRID(geometry, {int(srid)}), 4326)'
+        select = ', '.join(
+            f'ST_Multi({transform})' if xx == 'geometry' else f'"{xx}"'
+            for xx in df.columns
+        )
+
+    where = ''
+    if skip is not None:
+        where = f'WHERE NOT EXISTS (SELECT 1 FROM ssurgo.{skip[0]} AS t ' \
+            f'WHERE t.{skip[1]} = b.{skip[1]}) '
+
+    with sync_session() as session:
+        types = dict(session.execute(sa.text(
+            'select column_name, data_type from information_schema.columns '
+            'where table_schema = :schema and table_name = :name'
+        ), {'schema': schema, 'name': name}).fetchall())
+        # integers with missing values are floats in pandas ('3.0')
+        for col in df.columns:
+            if types.get(col) in ['smallint', 'integer', 'bigint'] and \
+                    df[col].dtype.kind == 'f':
+                df[col] = df[col].round().astype('Int64')
+
+        session.execute(sa.text(
+            f'CREATE TEMPORARY TABLE bulk_{name} ON COMMIT DROP AS '
+            f'SELECT {cols} FROM {schema}.{name} WITH NO DATA'
+        ))
+        if srid is not None:  # any geometry type and crs
+            session.execute(sa.text(
+                f'ALTER TABLE bulk_{name} ALTER COLUMN geometry TYPE geometry'
+            ))
+        copy_csv(session, df, f'bulk_{name}')
+        res = session.execute(sa.text(
+            f'INSERT INTO {schema}.{name} ({cols}) '
+            f'SELECT {select} FROM bulk_{name} AS b {where}'
+            'ON CONFLICT DO NOTHING'
+        ), params)
+        return res.rowcount
@@ -3,10 +3,26 @@ import requests
 import glob
 import lxml.html as lx
 import json
-from soil_scripts import utils
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from zipfile import BadZipFile, ZipFile
+from soil_scripts import config, utils
 from soil_scripts.config import DOWNLOAD_FOLDER
 
 session = requests.Session()
+# downloads run in threads, every thread has its own session
+_local = threading.local()
+
+
+class DownloadError(Exception):
+    ...
+
+
+def thread_session() -> requests.Session:
+    if not hasattr(_local, 'session'):
+        _local.session = requests.Session()
+    return _local.session
 
 
 def from_json(data: dict) -> list:
@@ -15,7 +31,7 @@ def from_json(data: dict) -> list:
     for i in items:
         if i["type"] != "file":
             continue
-        zip_files.append([i["name"], i["typedID"]])
+        zip_files.append([i["name"], i["typedID"], i.get("itemSize")])
     return zip_files
 
 
@@ -26,7 +42,7 @@ def json_with_files(pg: int) -> dict:
     }
     # TODO: Before run check if this is valid path - from time time this is
     # changed on server
-    list_url = 'https://nrcs.app.box.com/v/soils/folder/180112652169?page={}'
+    list_url = config.DOWNLOAD_LIST_URL
 
     itry = 0
     while itry < 4:
@@ -59,40 +75,101 @@ def str2json(text: str) -> dict:
     return js
 
 
+def verify_zip(file_path: str, size: int = None) -> bool:
+    """
+    Checks downloaded file - expected size (if known) and CRC of all zip
+    members (config.DOWNLOAD_VERIFY_CRC)
+    """
+    if size is not None and os.path.getsize(file_path) != size:
+        return False
+    try:
+        with ZipFile(file_path) as zf:
+            if config.DOWNLOAD_VERIFY_CRC:
+                return zf.testzip() is None
+            return True
+    except (BadZipFile, OSError):
+        return False
+
+
+def fetch(url: str, file_path: str, size: int = None, headers: dict = None,
+          verify=verify_zip) -> None:
+    """
+    Downloads url to file_path. Data goes to file_path.part first, when
+    part exists download is resumed by HTTP Range request. File gets its
+    final name only after verification (size, zip CRC), failed attempts are
+    retried config.DOWNLOAD_RETRIES times with exponential backoff.
+    Raises DownloadError when file cannot be downloaded
+    """
+    part = file_path + '.part'
+    for attempt in range(config.DOWNLOAD_RETRIES + 1):
+        if attempt > 0:
+            time.sleep(config.DOWNLOAD_BACKOFF * 2 ** (attempt - 1))
+        try:
+            done = os.path.getsize(part) if os.path.isfile(part) else 0
+            hdr = dict(headers or {})
+            if done > 0:
+                hdr['Range'] = f'bytes={done}-'
+            with thread_session().get(url, headers=hdr, allow_redirects=True,
+                                      stream=True, timeout=60) as r:
+                if r.status_code == 416:  # part is already complete
+                    total = done
+                else:
+                    r.raise_for_status()
+                    if r.status_code != 206:  # no range support - restart
+                        done = 0
+                    length = r.headers.get('Content-Length')
+                    total = done + int(length) if length else None
+                    with open(part, 'ab' if done else 'wb',
+                              buffering=config.DOWNLOAD_CHUNK) as fl:
+                        for chunk in r.iter_content(
+                            chunk_size=config.DOWNLOAD_CHUNK
+                        ):
+                            fl.write(chunk)
+            if total is not None and os.path.getsize(part) < total:
+                continue  # connection dropped, resume
+            if not verify(part, size):
+                os.remove(part)  # broken file, download from start
+                continue
+            os.replace(part, file_path)
+            return
+        except requests.RequestException:
+            continue
+    raise DownloadError(f'Cannot download {url}')
+
+
 def download_file(fl_tab: list) -> bool:
     flname = fl_tab[0]
     flurl = fl_tab[1]
+    size = fl_tab[2] if len(fl_tab) > 2 else None
 
     utils.log_event(f'Start dowloading SSURGO db: {flname}')
 
     file_path = os.path.join(DOWNLOAD_FOLDER, flname)
     if os.path.isfile(file_path):
-        utils.log_event(f'Downloaded {flname}')
-        return True
+        if verify_zip(file_path, size):
+            utils.log_event(f'Downloaded {flname}')
+            return True
+        os.remove(file_path)  # truncated or broken file
     headers = {
         "User-Agent": "Mozilla/5.0 (X11; Linux x86_64; rv:101.0) "
         "Gecko/20100101 Firefox/101.0"
     }
-    url = "https://nrcs.app.box.com/index.php" + \
-        f"?rm=box_download_shared_file&vanity_name=soils&file_id={flurl}"
-
-    with session.get(url,
-                     headers=headers,
-                     allow_redirects=True,
-                     stream=True,) as r:
-        r.raise_for_status()
-        with open(file_path, "wb") as f:
-            for chunk in r.iter_content(chunk_size=8192):
-                f.write(chunk)
+    url = config.DOWNLOAD_URL.format(file_id=flurl)
+
+    fetch(url, file_path, size, headers)
     utils.log_event(f'Downloaded {flname}')
     return True
 
 
-def download_ssurgo(selected_states: [str, str] = []) -> None:
+def file_state(fl_tab: list) -> str:
+    """State code from file name (gSSURGO_IA.zip)"""
+    return fl_tab[0].split('_')[-1].replace('.zip', '')
+
+
+def list_ssurgo(selected_states: [str, str] = []) -> list:
     """
-    download ssurgo dbs for all or selected states
-    If You need only specified states pass list with states codes
-    ie ['IA', 'IL', 'ND']
+    List of files ([name, id, size]) of all or selected states in Box
+    folder, None if list cannot be downloaded
     """
     pcnt = 1  # page counter
     fls = []  # list with all files
@@ -106,24 +183,33 @@ def download_ssurgo(selected_states: [str, str] = []) -> None:
         fls += fljs
         if pcnt > 30:
             utils.log_event('Error downloading ssurgo db list', ltype='ERROR')
-            return
+            return None
 
-    to_download = []
     if len(selected_states) > 0:
-        for it in fls:
-            if it[0].split('_')[-1].replace('.zip', '') in selected_states:
-                to_download.append(it)
-    else:
-        to_download = fls
-
-    for dw in to_download:
-        download_file(dw)
+        return [it for it in fls if file_state(it) in selected_states]
+    return fls
+
+
+def download_ssurgo(selected_states: [str, str] = []) -> None:
+    """
+    download ssurgo dbs for all or selected states
+    If You need only specified states pass list with states codes
+    ie ['IA', 'IL', 'ND']
+    """
+    to_download = list_ssurgo(selected_states)
+    if to_download is None:
+        return
+
+    def download(dw: list) -> None:
         try:
             download_file(dw)
         except Exception:
             utils.log_event(f'Error downloading ssurgo for state {dw[0]}',
                             ltype='ERROR')
 
+    with ThreadPoolExecutor(config.DOWNLOAD_WORKERS) as pool:
+        list(pool.map(download, to_download))
+
 
 if __name__ == '__main__':
     download_ssurgo()
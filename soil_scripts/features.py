@@ -0,0 +1,186 @@
+import math
+
+import sqlalchemy as sa
+
+from . import config
+from .db import sync_session
+from .summary import VALID_GEOM
+from .tiles import SOURCE, WORLD_SIZE, intersects, source_geom
+
+STREAM_CHUNK = 64 * 1024
+# meters in one degree on equator, used to turn tolerance into degrees
+DEGREE = 111320
+
+# attributes of ssurgo.poly_aggreg_mat returned by features endpoints
+POLY_COLUMNS = [
+    'mukey',
+    'musym',
+    'state',
+    'muname',
+    'nccpi3corn',
+    'nccpi3soy',
+    'nccpi3cot',
+    'nccpi3sg',
+    'nccpi3all',
+    'csr',
+    'di',
+    'pi_forest',
+    'pi',
+    'soil_index_base',
+    'csr2',
+    'cpi',
+]
+
+
+def generalization(bounds: list, tolerance: float = None,
+                   zoom: int = None, precision: int = None) -> dict:
+    """
+    Returns simplification tolerance (degrees) and coordinates precision
+    (decimal digits) for query covering bounds. Tolerance can be passed in
+    meters or derived from map zoom, by default it is bbox size divided by
+    config.SIMPLIFY_PIXELS - so small areas are not simplified at all.
+    Precision by default is one digit finer than tolerance.
+    tolerance=0 turns off simplification and precision reduction (passed
+    precision is still applied)
+    """
+    if tolerance is not None:
+        tol = tolerance / DEGREE
+    elif zoom is not None:
+        tol = WORLD_SIZE / 256 / 2 ** zoom / DEGREE
+    else:
+        size = max(bounds[2] - bounds[0], bounds[3] - bounds[1])
+        tol = size / config.SIMPLIFY_PIXELS
+    if tol <= 0:
+        tol = 0
+    elif precision is None:
+        precision = math.ceil(-math.log10(tol)) + 1
+    if precision is not None:
+        precision = min(max(precision, config.PRECISION_MIN), 9)
+    return {'tolerance': tol, 'precision': precision}
+
+
+def output_geom(col: str, gen: dict = None) -> str:
+    """
+    Geometry expression simplified and snapped to grid according to gen,
+    for pa.geometry pre-simplified column is used if tolerance allows
+    """
+    if not gen:
+        return col
+    if col == 'pa.geometry':
+        col = source_geom((gen.get('tolerance') or 0) * DEGREE)
+    if gen.get('tolerance'):
+        col = f'ST_SimplifyPreserveTopology({col}, :tolerance)'
+    if gen.get('precision') is not None:
+        col = f'ST_Multi(ST_ReducePrecision({col}, :gridsize))'
+    return col
+
+
+def generalization_params(gen: dict = None) -> dict:
+    """Bind parameters for output_geom and iter_features"""
+    if not gen:
+        return {}
+    params = {'tolerance': gen.get('tolerance') or 0}
+    if gen.get('precision') is not None:
+        params['gridsize'] = 10 ** -gen['precision']
+        params['maxdigits'] = gen['precision']
+    return params
+
+
+def bbox_sql(gen: dict = None) -> str:
+    """
+    Query with mupolygons intersecting bbox, expects xmin, ymin, xmax, ymax
+    bind parameters (EPSG:4326) and generalization_params(gen)
+    """
+    cols = ',\n        '.join(f'pa.{xx}' for xx in POLY_COLUMNS)
+    envelope = intersects('ST_MakeEnvelope(:xmin, :ymin, :xmax, :ymax, 4326)')
+    return f'''
+    SELECT
+        {cols},
+        {output_geom('pa.geometry', gen)} AS geometry
+    FROM {SOURCE} AS pa
+    WHERE {envelope}
+    '''
+
+
+def poly_sql(gen: dict = None) -> str:
+    """
+    Query with mupolygons clipped to AOI passed as :wkt (EPSG:4326,
+    repaired as in summary) with total_area, area_AOI and area_perc
+    calculated in EPSG:5070 (on full geometries), expects
+    generalization_params(gen) bind parameters
+    """
+    cols = ',\n            '.join(f'pa.{xx}' for xx in POLY_COLUMNS)
+    out_cols = ',\n        '.join(POLY_COLUMNS)
+    return f'''
+    WITH aoi AS (
+        SELECT {VALID_GEOM.format('ST_GeomFromText(:wkt, 4326)')} AS geom
+    ),
+    clipped AS (
+        SELECT
+            {cols},
+            pa.area_5070 AS total_area,
+            ST_Multi(ST_CollectionExtract(
+                ST_Intersection(pa.geometry, aoi.geom), 3
+            )) AS geometry
+        FROM
+            {SOURCE} AS pa,
+            aoi
+        WHERE {intersects('aoi.geom')}
+    ),
+    areas AS (
+        SELECT
+            *,
+            ST_Area(ST_Transform(geometry, 5070)) AS "area_AOI"
+        FROM clipped
+        WHERE NOT ST_IsEmpty(geometry)
+    )
+    SELECT
+        {out_cols},
+        total_area,
+        "area_AOI",
+        "area_AOI" / NULLIF(sum("area_AOI") OVER (), 0) * 100 AS area_perc,
+        {output_geom('geometry', gen)} AS geometry
+    FROM areas
+    '''
+
+
+def iter_features(sql: str, params: dict):
+    """
+    Generator with GeoJSON features (text) built in db by ST_AsGeoJSON from
+    rows of sql (geometry column 'geometry'), rows are read by server side
+    cursor so features are never held in memory all together
+    """
+    digits = ':maxdigits' if 'maxdigits' in params else '9'
+    sql = f'SELECT ST_AsGeoJSON(ft.*, \'geometry\', {digits}) AS ft ' \
+        f'FROM ({sql}) AS ft'
+    with sync_session() as session:
+        res = session.execute(
+            sa.text(sql), params,
+            execution_options={'stream_results': True},
+        )
+        for row in res:
+            yield row.ft
+
+
+def stream_geojson(sql: str, params: dict, fmt: str = 'geojson'):
+    """
+    Generator with response chunks (about STREAM_CHUNK bytes) -
+    FeatureCollection (geojson) or one feature per line (ndjson)
+    """
+    ndjson = fmt == 'ndjson'
+    buf = [] if ndjson else ['{"type": "FeatureCollection", "features": [']
+    size = 0
+    sep = ''
+    for ft in iter_features(sql, params):
+        buf += [sep, ft]
+        sep = '\n' if ndjson else ',\n'
+        size += len(ft)
+        if size >= STREAM_CHUNK:
+            yield ''.join(buf)
+            buf = []
+            size = 0
+    if ndjson:
+        buf.append('\n' if sep else '')
+    else:
+        buf.append(']}')
+    yield ''.join(buf)
@@ -0,0 +1,98 @@
+import io
+import os
+import tempfile
+
+import geopandas as gpd
+
+# output formats of features endpoints - format: mimetype, geojson and ndjson
+# are streamed (see features.stream_geojson), others are built from
+# GeoDataFrame with WKB geometries
+FORMATS = {
+    'geojson': 'application/json',
+    'ndjson': 'application/geo+json-seq',
+    'parquet': 'application/vnd.apache.parquet',
+    'arrow': 'application/vnd.apache.arrow.stream',
+    'fgb': 'application/flatgeobuf',
+}
+ALIASES = {
+    'json': 'geojson',
+    'geojsonseq': 'ndjson',
+    'geoparquet': 'parquet',
+    'ipc': 'arrow',
+    'flatgeobuf': 'fgb',
+}
+STREAMED = ['geojson', 'ndjson']
+
+
+class FormatError(Exception):
+    ...
+
+
+def negotiate(fmt: str = None, accept=None) -> str:
+    """
+    Returns output format from ?f= parameter or Accept header (werkzeug
+    MIMEAccept), geojson is default
+    """
+    if fmt:
+        fmt = ALIASES.get(fmt.lower(), fmt.lower())
+        if fmt not in FORMATS:
+            raise FormatError(
+                f'Unknown format {fmt}, use one of: {", ".join(FORMATS)}'
+            )
+        return fmt
+    if accept is not None:
+        best = accept.best_match(list(FORMATS.values()))
+        for key, mimetype in FORMATS.items():
+            if mimetype == best:
+                return key
+    return 'geojson'
+
+
+def to_geoparquet(gdf: gpd.GeoDataFrame) -> bytes:
+    buf = io.BytesIO()
+    gdf.to_parquet(buf, index=False)
+    return buf.getvalue()
+
+
+def to_arrow(gdf: gpd.GeoDataFrame) -> bytes:
+    """Arrow IPC stream, geometry as WKB column (geoarrow.wkb extension)"""
+    import pyarrow as pa
+
+    df = gdf.to_wkb()
+    table = pa.Table.from_pandas(df, preserve_index=False)
+    ix = table.schema.get_field_index(gdf.geometry.name)
+    field = table.schema.field(ix).with_metadata({
+        'ARROW:extension:name': 'geoarrow.wkb',
+        'ARROW:extension:metadata': '{"crs": "EPSG:4326"}',
+    })
+    table = table.set_column(ix, field, table.column(ix))
+
+    sink = pa.BufferOutputStream()
+    with pa.ipc.new_stream(sink, table.schema) as writer:
+        writer.write_table(table)
+    return sink.getvalue().to_pybytes()
+
+
+def to_flatgeobuf(gdf: gpd.GeoDataFrame) -> bytes:
+    """FlatGeobuf with spatial index, written by GDAL to temporary file"""
+    if gdf.shape[0] == 0:  # GDAL does not write empty layers
+        return b''
+    with tempfile.TemporaryDirectory() as tmp:
+        pth = os.path.join(tmp, 'features.fgb')
+        gdf.to_file(pth, driver='FlatGeobuf')
+        with open(pth, 'rb') as fl:
+            return fl.read()
+
+
+def encode(gdf: gpd.GeoDataFrame, fmt: str) -> bytes:
+    """Encodes features to binary format, raises FormatError if not possible"""
+    try:
+        if fmt == 'parquet':
+            return to_geoparquet(gdf)
+        if fmt == 'arrow':
+            return to_arrow(gdf)
+        if fmt == 'fgb':
+            return to_flatgeobuf(gdf)
+    except ImportError:
+        raise FormatError(f'Format {fmt} is not supported (no pyarrow)')
+    raise FormatError(f'Format {fmt} cannot be encoded')
@@ -0,0 +1,163 @@
+import logging
+import os
+import queue
+import sys
+import threading
+import time
+from datetime import datetime
+from multiprocessing import util
+
+import sqlalchemy as sa
+
+from . import config
+from .db import sync_session
+
+# Import log written to ssurgo.importlog by background thread - records are
+# queued by logging calls and inserted in batches, so logging never waits for
+# db. Structured fields are passed as extra of logging call:
+#   logger.info('uploaded mapunit table', extra={'state': 'IA', 'rows': 10})
+LOGGER_NAME = 'ssurgo.import'
+FIELDS = ['state', 'stage', 'rows', 'duration']
+# columns added to importlog tables of older databases
+COLUMNS = {
+    'state': 'VARCHAR (20)',
+    'stage': 'VARCHAR (50)',
+    'rows': 'BIGINT',
+    'duration': 'DOUBLE PRECISION',
+}
+INSERT_SQL = '''
+    INSERT INTO ssurgo.importlog
+        (timelog, ltype, description, state, stage, rows, duration)
+    SELECT * FROM unnest(
+        CAST(:timelog AS timestamp[]),
+        CAST(:ltype AS text[]),
+        CAST(:description AS text[]),
+        CAST(:state AS text[]),
+        CAST(:stage AS text[]),
+        CAST(:rows AS bigint[]),
+        CAST(:duration AS double precision[])
+    )
+'''
+# markers put to queue between records
+_FLUSH = 'flush'
+_STOP = 'stop'
+
+
+class DbLogHandler(logging.Handler):
+    """
+    Logging handler writing records to ssurgo.importlog. emit() only puts
+    record to queue (config.LOG_QUEUE_SIZE, records are dropped when it is
+    full), writer thread inserts up to config.LOG_BATCH_SIZE records in one
+    query at least every config.LOG_FLUSH_SECONDS. flush() waits until queued
+    records are written, it is called on exit by logging.shutdown and by
+    multiprocessing finalizers in worker processes
+    """
+
+    def __init__(self, level: int = logging.NOTSET):
+        super().__init__(level)
+        self._pid = None
+        self._queue = None
+        self._thread = None
+        self._columns = False
+        self.dropped = 0
+
+    def _start(self) -> None:
+        # thread is (re)started on first record in process, forked
+        # processes get own queue and thread
+        self._pid = os.getpid()
+        self._queue = queue.Queue(config.LOG_QUEUE_SIZE)
+        self._thread = threading.Thread(
+            target=self._run, name='importlog', daemon=True
+        )
+        self._thread.start()
+        util.Finalize(self, self.flush, exitpriority=10)
+
+    def _running(self) -> bool:
+        return self._pid == os.getpid() and self._thread.is_alive()
+
+    def emit(self, record: logging.LogRecord) -> None:
+        try:
+            row = {
+                'timelog': datetime.fromtimestamp(record.created),
+                'ltype': 'info' if record.levelno <= logging.INFO
+                else record.levelname,
+                'description': self.format(record)[:254],
+                **{xx: getattr(record, xx, None) for xx in FIELDS},
+            }
+            if self._pid != os.getpid():
+                self._start()
+            self._queue.put_nowait(row)
+        except queue.Full:
+            self.dropped += 1
+        except Exception:
+            self.handleError(record)
+
+    def _run(self) -> None:
+        while True:
+            batch = [self._queue.get()]
+            deadline = time.monotonic() + config.LOG_FLUSH_SECONDS
+            while len(batch) < config.LOG_BATCH_SIZE and \
+                    batch[-1] not in (_FLUSH, _STOP):
+                try:
+                    batch.append(self._queue.get(
+                        timeout=max(deadline - time.monotonic(), 0)
+                    ))
+                except queue.Empty:
+                    break
+            self._write([xx for xx in batch if isinstance(xx, dict)])
+            for _ in batch:
+                self._queue.task_done()
+            if batch[-1] == _STOP:
+                return
+
+    def _write(self, rows: list) -> None:
+        if self.dropped > 0:
+            rows.append({
+                'timelog': datetime.now(),
+                'ltype': 'ERROR',
+                'description': f'{self.dropped} log records dropped, log '
+                               'queue was full',
+                **{xx: None for xx in FIELDS},
+            })
+            self.dropped = 0
+        if len(rows) == 0:
+            return
+        try:
+            with sync_session() as session:
+                if not self._columns:
+                    for col, tp in COLUMNS.items():
+                        session.execute(sa.text(
+                            'ALTER TABLE ssurgo.importlog '
+                            f'ADD COLUMN IF NOT EXISTS {col} {tp}'
+                        ))
+                    self._columns = True
+                session.execute(sa.text(INSERT_SQL), {
+                    col: [xx[col] for xx in rows]
+                    for col in ['timelog', 'ltype', 'description', *FIELDS]
+                })
+        except Exception as e:
+            # log is lost, import goes on
+            sys.stderr.write(
+                f'Cannot write {len(rows)} records to importlog: {e}\n'
+            )
+
+    def flush(self) -> None:
+        if self._thread is None or not self._running():
+            return
+        self._queue.put(_FLUSH)
+        self._queue.join()
+
+    def close(self) -> None:
+        if self._thread is not None and self._running():
+            self._queue.put(_STOP)
+            self._thread.join()
+        super().close()
+
+
+def get_logger() -> logging.Logger:
+    """Import logger with DbLogHandler, handler is added on first call"""
+    logger = logging.getLogger(LOGGER_NAME)
+    if not any(isinstance(xx, DbLogHandler) for xx in logger.handlers):
+        logger.addHandler(DbLogHandler())
+        logger.setLevel(logging.INFO)
+    return logger
@@ -0,0 +1,214 @@
+import os
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime
+
+import pandas as pd
+import sqlalchemy as sa
+
+from . import utils
+from .db import sync_session
+
+try:
+    import resource
+except ImportError:  # not unix, peak RSS is not measured
+    resource = None
+
+# Stage metrics of import - every measured stage (download, unzip, layer
+# loads) of state writes one row to ssurgo.importmetrics. Rows and bytes are
+# counted by read() and written() called inside measure() block, calls
+# outside of block are ignored, so loaders can be used without measuring.
+# Rows of one import run share run_id (IMPORT_RUN_ID, inherited by import
+# processes)
+RUN_ENV = 'IMPORT_RUN_ID'
+CREATE_SQL = '''
+    CREATE TABLE IF NOT EXISTS ssurgo.importmetrics (
+        timelog TIMESTAMP,
+        run_id VARCHAR (20),
+        state VARCHAR (20),
+        stage VARCHAR (50),
+        ok BOOLEAN,
+        seconds DOUBLE PRECISION,
+        rows_read BIGINT,
+        rows_written BIGINT,
+        rows_per_sec DOUBLE PRECISION,
+        bytes BIGINT,
+        peak_rss_mb DOUBLE PRECISION,
+        pid INTEGER
+    )
+'''
+COLUMNS = [
+    'timelog', 'run_id', 'state', 'stage', 'ok', 'seconds', 'rows_read',
+    'rows_written', 'rows_per_sec', 'bytes', 'peak_rss_mb', 'pid',
+]
+
+_local = threading.local()  # stack of measured stages of thread
+_created = False
+
+
+class Stage:
+    def __init__(self, state: str, name: str):
+        self.state = state
+        self.name = name
+        self.rows_read = 0
+        self.rows_written = 0
+        self.bytes = 0
+        self.started = time.perf_counter()
+
+
+def start_run() -> str:
+    """Sets id of import run (start time) for this and child processes"""
+    os.environ[RUN_ENV] = datetime.now().strftime('%Y%m%d%H%M%S')
+    return os.environ[RUN_ENV]
+
+
+def run_id() -> str:
+    if RUN_ENV not in os.environ:
+        start_run()
+    return os.environ[RUN_ENV]
+
+
+def peak_rss() -> float:
+    """Peak resident memory of process [MB], None if not available"""
+    if resource is None:
+        return None
+    # kilobytes on linux
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def _current() -> Stage:
+    stack = getattr(_local, 'stack', None)
+    return stack[-1] if stack else None
+
+
+def read(df: pd.DataFrame = None, rows: int = 0, nbytes: int = 0) -> None:
+    """Adds rows and bytes (memory of df or nbytes) read by current stage"""
+    stage = _current()
+    if stage is None:
+        return
+    if df is not None:
+        rows += df.shape[0]
+        nbytes += int(df.memory_usage(index=False, deep=True).sum())
+    stage.rows_read += rows
+    stage.bytes += nbytes
+
+
+def written(rows: int) -> None:
+    """Adds rows written to db by current stage"""
+    stage = _current()
+    if stage is not None and rows is not None and rows > 0:
+        stage.rows_written += rows
+
+
+@contextmanager
+def measure(state: str, name: str) -> Stage:
+    """
+    Measures block as stage name of state - wall time, rows read and written
+    (read(), written()), bytes and peak RSS of process at the end of stage
+    (one state per process in parallel import, all loaded states so far in
+    sequential one). Stage is saved also when block fails (ok false)
+    """
+    stage = Stage(state, name)
+    if getattr(_local, 'stack', None) is None:
+        _local.stack = []
+    _local.stack.append(stage)
+    ok = False
+    try:
+        yield stage
+        ok = True
+    finally:
+        _local.stack.pop()
+        save(stage, ok)
+
+
+def save(stage: Stage, ok: bool = True) -> None:
+    global _created
+    seconds = time.perf_counter() - stage.started
+    rows = stage.rows_written or stage.rows_read
+    row = {
+        'timelog': datetime.now(),
+        'run_id': run_id(),
+        'state': stage.state,
+        'stage': stage.name,
+        'ok': ok,
+        'seconds': seconds,
+        'rows_read': stage.rows_read,
+        'rows_written': stage.rows_written,
+        'rows_per_sec': rows / seconds if seconds > 0 else None,
+        'bytes': stage.bytes,
+        'peak_rss_mb': peak_rss(),
+        'pid': os.getpid(),
+    }
+    cols = ', '.join(COLUMNS)
+    try:
+        with sync_session() as session:
+            if not _created:
+                session.execute(sa.text(CREATE_SQL))
+                _created = True
+            session.execute(sa.text(
+                f'INSERT INTO ssurgo.importmetrics ({cols}) '
+                f'VALUES ({", ".join(":" + xx for xx in COLUMNS)})'
+            ), row)
+    except Exception as e:
+        # metrics are lost, import goes on
+        utils.log_event(
+            f'Cannot save metrics of {stage.name} for state - {stage.state}: '
+            f'{e}'[:254], 'ERROR'
+        )
+
+
+def report(run: str = None, by: str = 'stage') -> tuple:
+    """
+    Summary of import run (last one by default) grouped by stage or state,
+    returns (run id, wall time of run [s], DataFrame) - total seconds, rows,
+    rows/sec, MB, MB/s, max peak RSS and failed stages per group
+    """
+    group = 'state' if by == 'state' else 'stage'
+    with sync_session() as session:
+        if run is None:
+            run = session.execute(sa.text(
+                'SELECT max(run_id) FROM ssurgo.importmetrics'
+            )).scalar()
+        wall = session.execute(sa.text('''
+            SELECT extract(epoch FROM max(timelog) - min(
+                timelog - seconds * interval '1 second'))
+            FROM ssurgo.importmetrics
+            WHERE run_id = :run
+        '''), {'run': run}).scalar()
+        df = pd.read_sql(sa.text(f'''
+            SELECT
+                {group},
+                count(*) AS stages,
+                round(sum(seconds)::numeric, 1) AS seconds,
+                sum(rows_read) AS rows_read,
+                sum(rows_written) AS rows_written,
+                round((sum(greatest(rows_written, rows_read))
+                    / NULLIF(sum(seconds), 0))::numeric) AS rows_per_sec,
+                round(sum(bytes) / 1024.0 ^ 2) AS mb,
+                round((sum(bytes) / 1024.0 ^ 2
+                    / NULLIF(sum(seconds), 0))::numeric, 1) AS mb_per_sec,
+                round(max(peak_rss_mb)::numeric) AS peak_rss_mb,
+                count(*) FILTER (WHERE NOT ok) AS failed
+            FROM ssurgo.importmetrics
+            WHERE run_id = :run
+            GROUP BY {group}
+            ORDER BY sum(seconds) DESC
+        '''), con=session.connection(), params={'run': run})
+    return run, wall, df
+
+
+def runs() -> pd.DataFrame:
+    """Import runs with number of states, start and end time"""
+    with sync_session() as session:
+        return pd.read_sql(sa.text('''
+            SELECT
+                run_id,
+                count(DISTINCT state) AS states,
+                min(timelog - seconds * interval '1 second') AS started,
+                max(timelog) AS finished,
+                count(*) FILTER (WHERE NOT ok) AS failed
+            FROM ssurgo.importmetrics
+            GROUP BY run_id
+            ORDER BY run_id
+        '''), con=session.connection())
@@ -1,7 +1,10 @@
 import os
+import numpy as np
 import pandas as pd
 import geopandas as gpd
 
+from . import metrics
+
 
 # only favorable soils are used (first 3 values) - no
 # table provided to separete one from another, but there is column in csv where
@@ -61,10 +64,46 @@ def calculate_pi_val(code: str) -> int:
     return round(val * letters[letter][int(ind+fav)])
 
 
+def pi_lookup(ratings: pd.DataFrame = dv) -> pd.Series:
+    """
+    PI of every musym of ratings table indexed by musym - vectorized
+    calculate_pi_val: musyms are split to soil code, slope letter and erosion
+    class once and factors are taken from letters matrix
+    """
+    ratings = ratings.drop_duplicates('musym').set_index('musym')
+    code = ratings.index.to_series().astype(str)
+    keys = list(letters.keys())
+
+    # last letter (in letters order) found in musym wins, as in loop above
+    soil_code = pd.Series('', index=code.index)
+    slope_code = pd.Series('', index=code.index)
+    letter = pd.Series(0, index=code.index)
+    for ii, li in enumerate(keys):
+        has = code.str.contains(li, regex=False)
+        soil_code = soil_code.mask(has, code.str.partition(li)[0])
+        slope_code = slope_code.mask(has, code.str.rpartition(li)[2])
+        letter = letter.mask(has, ii)
+    slope_code = slope_code.where(slope_code.isin(['3', '2']), '')
+    # there are some other caps letters in soil names like L but they are
+    # treated as A
+    no_soil = soil_code == ''
+    slope_code = slope_code.mask(no_soil, '')
+    letter = letter.mask(no_soil, 0)
+
+    # unfavorable soils use columns [3:6] from letters
+    fav = np.where(ratings.unfavorable == 0, 0, 3)
+    ind = np.select([slope_code == '2', slope_code == '3'], [1, 2], 0)
+    factor = np.array([letters[xx] for xx in keys])[letter.values, ind + fav]
+    return pd.Series(
+        np.round(ratings.value.values * factor), index=ratings.index
+    )
+
+
 def process_pi(pth: str) -> pd.DataFrame:
     df = gpd.read_file(pth, layer='mapunit', ignore_geometry=True)
+    metrics.read(df)
 
-    df.loc[:, 'pi'] = df.apply(lambda xx: calculate_pi_val(xx.musym), axis=1)
+    df.loc[:, 'pi'] = df.musym.map(pi_lookup())
     return df[['mukey', 'pi']]
 
 
@@ -0,0 +1,90 @@
+import warnings
+
+import pandas as pd
+from pyproj import CRS
+
+from . import config
+
+# Streaming reader of geodatabase layers - layer is read once, in record
+# batches, geometries are kept as WKB (no shapely objects), they are
+# transformed and promoted to multi in db (see db.bulk_load srid)
+
+
+def srid(crs):
+    """
+    EPSG code of layer crs (wkt, proj string or dict), PROJ string if crs has
+    no EPSG code (ie ESRI:102007 Hawaii Albers) - db transforms geometries
+    from it (see db.bulk_load srid)
+    """
+    crs = CRS.from_user_input(crs)
+    code = crs.to_epsg()
+    if code is not None:
+        return code
+    with warnings.catch_warnings():
+        warnings.simplefilter('ignore')  # PROJ string may lose datum details
+        return crs.to_proj4().replace(' +type=crs', '')
+
+
+def vsi_path(zip_path: str, gdb: str) -> str:
+    """
+    GDAL path of geodatabase gdb (folder name in archive) read straight from
+    zip file, zip_path can be local file or http(s) url - archive is then
+    read by range requests (/vsicurl/), server must support them
+    """
+    if zip_path.startswith(('http://', 'https://')):
+        zip_path = f'/vsicurl/{zip_path}'
+    return f'/vsizip/{zip_path}/{gdb}'
+
+
+def _batches_arrow(dbf: str, layer: str, batch_size: int):
+    import pyarrow as pa
+    from pyogrio.raw import open_arrow
+
+    with open_arrow(dbf, layer=layer, batch_size=batch_size) as (meta, rdr):
+        if not isinstance(rdr, pa.RecordBatchReader):  # newer pyogrio
+            rdr = pa.RecordBatchReader.from_stream(rdr)
+        geom = meta.get('geometry_name') or 'wkb_geometry'
+        code = srid(meta['crs'])
+        for batch in rdr:
+            df = batch.to_pandas()
+            df.rename(columns={geom: 'geometry'}, inplace=True)
+            yield df, code
+
+
+def _batches_fiona(dbf: str, layer: str, batch_size: int):
+    import fiona
+    from shapely.geometry import shape
+
+    with fiona.open(dbf, layer=layer) as src:
+        code = srid(src.crs_wkt)
+        rows = []
+        for ft in src:
+            row = dict(ft['properties'])
+            row['geometry'] = shape(ft['geometry']).wkb \
+                if ft['geometry'] else None
+            rows.append(row)
+            if len(rows) == batch_size:
+                yield pd.DataFrame(rows), code
+                rows = []
+        if len(rows) > 0:
+            yield pd.DataFrame(rows), code
+
+
+def iter_batches(dbf: str, layer: str, batch_size: int = None):
+    """
+    Generator with (DataFrame, srid) - batches of batch_size features
+    (config.READ_BATCH_SIZE by default) of geodatabase layer, column names in
+    lower case, 'geometry' column with WKB in layer crs (srid - EPSG code or
+    PROJ string). Arrow
+    batches of pyogrio are used, fiona (one pass over features) if pyogrio
+    is not installed
+    """
+    batch_size = batch_size or config.READ_BATCH_SIZE
+    try:
+        import pyogrio  # noqa: F401
+        batches = _batches_arrow(dbf, layer, batch_size)
+    except ImportError:
+        batches = _batches_fiona(dbf, layer, batch_size)
+    for df, code in batches:
+        df.rename(columns={xx: xx.lower() for xx in df.columns}, inplace=True)
+        yield df, code
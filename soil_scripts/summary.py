@@ -0,0 +1,232 @@
+import io
+import json
+
+import sqlalchemy as sa
+from shapely.geometry import shape
+from shapely.ops import unary_union
+from shapely.wkt import loads
+
+from . import config
+from .db import sync_session
+from .tiles import SOURCE
+
+# AOIs are keyed by position (aoi_no), ids given by user (aoi_id) can be
+# repeated. Invalid geometries are repaired, only polygons are kept
+VALID_GEOM = 'ST_CollectionExtract(ST_MakeValid({}), 3)'
+# single AOI passed as :wkt bind parameter
+AOI_WKT = "SELECT 0 AS aoi_no, '0'::text AS aoi_id, " + \
+    VALID_GEOM.format('ST_GeomFromText(:wkt, 4326)') + ' AS geom'
+# many AOIs loaded to temporary table, see batch_summary()
+AOI_BATCH = 'SELECT aoi_no, aoi_id, geom FROM aoi_batch'
+
+
+class AoiError(Exception):
+    ...
+
+
+def read_geometry(data: str):
+    """
+    Reads AOI from WKT or GeoJSON (geometry, Feature or FeatureCollection -
+    all features are merged to one geometry), returns shapely geometry or
+    None if input cannot be read
+    """
+    data = data.strip()
+    try:
+        if not data.startswith('{'):
+            return loads(data)
+        js = json.loads(data)
+        if js.get('type') == 'FeatureCollection':
+            return unary_union(
+                [shape(ft['geometry']) for ft in js['features']]
+            )
+        if js.get('type') == 'Feature':
+            return shape(js['geometry'])
+        return shape(js)
+    except Exception:
+        return None
+
+
+def feature_id(ft: dict, ii: int, id_field: str = None) -> str:
+    """AOI id - property id_field, feature id or position in input"""
+    props = ft.get('properties') or {}
+    if id_field and props.get(id_field) is not None:
+        return str(props[id_field])
+    if ft.get('id') is not None:
+        return str(ft['id'])
+    return str(ii)
+
+
+def read_aois(data: bytes, fmt: str = 'geojson',
+              id_field: str = None) -> list:
+    """
+    Reads many AOIs as list of (aoi_id, shapely geometry) from
+    - geojson - FeatureCollection
+    - ndjson - one Feature per line (GeoJSONSeq)
+    - parquet - GeoParquet file (needs pyarrow), id_field column is used as
+      AOI id, index otherwise
+    geometries should be in EPSG:4326, raises AoiError on wrong input
+    """
+    try:
+        if fmt == 'parquet':
+            import geopandas as gpd
+            gdf = gpd.read_parquet(io.BytesIO(data)).to_crs(4326)
+            ids = gdf[id_field] if id_field in gdf.columns else gdf.index
+            aois = list(zip(map(str, ids), gdf.geometry))
+        elif fmt == 'ndjson':
+            aois = []
+            for ii, line in enumerate(data.decode().splitlines()):
+                if line.strip().strip('\x1e') == '':
+                    continue
+                ft = json.loads(line.strip().strip('\x1e'))
+                aois.append(
+                    (feature_id(ft, ii, id_field), shape(ft['geometry']))
+                )
+        else:
+            js = json.loads(data)
+            aois = [
+                (feature_id(ft, ii, id_field), shape(ft['geometry']))
+                for ii, ft in enumerate(js['features'])
+            ]
+    except ImportError:
+        raise AoiError('GeoParquet input is not supported (no pyarrow)')
+    except Exception as e:
+        raise AoiError(f'Cannot read AOIs: {e}')
+
+    aois = [(aid, geom) for aid, geom in aois
+            if geom is not None and not geom.is_empty]
+    if len(aois) > config.BATCH_MAX_AOIS:
+        raise AoiError(f'Max number of AOIs is {config.BATCH_MAX_AOIS}')
+    return aois
+
+
+def summary_sql(aoi: str = AOI_WKT) -> str:
+    """
+    Builds query returning one row (aoi_id, summary as json text) per AOI
+    with areas and attributes per mukey and field averages of
+    config.SUMMARY_ATTRS weighted by mukey area. aoi is query returning
+    aoi_no (unique position of AOI), aoi_id and geom (EPSG:4326), rows are
+    ordered by aoi_no
+    """
+    attrs = ''.join(f',\n            ma.{xx}' for xx in config.SUMMARY_ATTRS)
+    ma_attrs = ', '.join(f'pa.{xx}' for xx in config.SUMMARY_ATTRS)
+    mukey_attrs = ''.join(
+        f",\n            '{xx}', {xx}" for xx in config.SUMMARY_ATTRS
+    )
+    weighted = ',\n            '.join(
+        f"'{xx}', round(sum({xx} * \"area_AOI\")::numeric / NULLIF(sum("
+        f"\"area_AOI\") FILTER (WHERE {xx} IS NOT NULL), 0)::numeric, 4)"
+        for xx in config.SUMMARY_ATTRS
+    )
+    # subdivided pieces are summed up to the same area as full polygons
+    pieces = 'ssurgo.mupolygon_subdiv' if config.USE_SUBDIVIDED \
+        else 'ssurgo.mupolygon'
+    return f'''
+    WITH aoi AS (
+        {aoi}
+    ),
+    parts AS (
+        SELECT
+            aoi.aoi_no,
+            sd.mukey,
+            ST_Area(ST_Transform(
+                ST_Intersection(sd.geometry, aoi.geom), 5070
+            )) AS area
+        FROM
+            aoi
+            JOIN {pieces} AS sd
+                ON ST_Intersects(sd.geometry, aoi.geom)
+    ),
+    mukeys AS (
+        SELECT aoi_no, mukey, sum(area) AS "area_AOI"
+        FROM parts
+        GROUP BY aoi_no, mukey
+        HAVING sum(area) > 0
+    ),
+    attrs AS (
+        SELECT
+            mk.aoi_no,
+            mk.mukey,
+            mk."area_AOI",
+            mk."area_AOI" / sum(mk."area_AOI") OVER (
+                PARTITION BY mk.aoi_no
+            ) * 100 AS area_perc{attrs}
+        FROM
+            mukeys AS mk
+            LEFT JOIN LATERAL (
+                SELECT {ma_attrs}
+                FROM {SOURCE} AS pa
+                WHERE pa.mukey = mk.mukey
+                LIMIT 1
+            ) AS ma ON true
+    )
+    SELECT aoi.aoi_id, json_build_object(
+        'id', aoi.aoi_id,
+        'area_AOI', round(COALESCE(sum("area_AOI"), 0)::numeric, 2),
+        'mukeys', COALESCE(json_agg(json_build_object(
+            'mukey', mukey,
+            'area_AOI', round("area_AOI"::numeric, 2),
+            'area_perc', round(area_perc::numeric, 4){mukey_attrs}
+        ) ORDER BY "area_AOI" DESC) FILTER (WHERE mukey IS NOT NULL),
+            '[]'::json),
+        'weighted', json_build_object(
+            {weighted}
+        )
+    )::text AS summary
+    FROM
+        aoi
+        LEFT JOIN attrs USING (aoi_no)
+    GROUP BY aoi.aoi_no, aoi.aoi_id
+    ORDER BY aoi.aoi_no;
+    '''
+
+
+def get_summary(aoi) -> dict:
+    """Returns soil summary (see summary_sql) for shapely geometry"""
+    with sync_session() as session:
+        res = session.execute(
+            sa.text(summary_sql()), {'wkt': aoi.wkt}
+        ).fetchone()
+    res = json.loads(res.summary)
+    del res['id']
+    return res
+
+
+def batch_summary(aois: list):
+    """
+    Generator with summaries (json text) for list of (aoi_id, geometry).
+    AOIs are loaded to temporary table with spatial index and joined with
+    mupolygons in one query, results are read from server side cursor in
+    order of aois.
+    """
+    with sync_session() as session:
+        session.execute(sa.text(
+            'CREATE TEMPORARY TABLE aoi_batch '
+            '(aoi_no integer, aoi_id text, geom geometry(Geometry, 4326)) '
+            'ON COMMIT DROP'
+        ))
+        for ii in range(0, len(aois), config.BATCH_INSERT_SIZE):
+            chunk = aois[ii:ii+config.BATCH_INSERT_SIZE]
+            geom = VALID_GEOM.format(
+                'ST_GeomFromWKB(decode(wkb, \'hex\'), 4326)'
+            )
+            session.execute(sa.text(
+                'INSERT INTO aoi_batch (aoi_no, aoi_id, geom) '
+                f'SELECT aoi_no, aoi_id, {geom} '
+                'FROM unnest(CAST(:nos AS integer[]), CAST(:ids AS text[]), '
+                'CAST(:wkbs AS text[])) AS t(aoi_no, aoi_id, wkb)'
+            ), {
+                'nos': list(range(ii, ii + len(chunk))),
+                'ids': [aid for aid, _ in chunk],
+                'wkbs': [geom.wkb_hex for _, geom in chunk],
+            })
+        session.execute(sa.text(
+            'CREATE INDEX ON aoi_batch USING GIST (geom)'
+        ))
+        session.execute(sa.text('ANALYZE aoi_batch'))
+
+        res = session.execute(
+            sa.text(summary_sql(AOI_BATCH)),
+            execution_options={'stream_results': True},
+        )
+        for row in res:
+            yield row.summary
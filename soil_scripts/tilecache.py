@@ -0,0 +1,162 @@
+import hashlib
+import logging
+import math
+import os
+import sqlite3
+from contextlib import contextmanager
+
+from . import config
+
+# On disk tile cache - single SQLite file (MBTiles like layout) shared by all
+# API workers. Tiles are keyed by z/x/y, requested layers and data version
+# (config.TILE_CACHE_VERSION), so after SSURGO release change old tiles are
+# never served. Import invalidates tiles covering imported state.
+# Cache is best effort - when file cannot be read or written (permissions,
+# locked or broken file) tiles are served uncached.
+MAX_ZOOM = 22
+# errors of cache file, cache_db creates folder of file
+CACHE_ERRORS = (sqlite3.Error, OSError)
+
+logger = logging.getLogger(__name__)
+
+
+@contextmanager
+def cache_db() -> sqlite3.Connection:
+    """
+    Opens connection to cache file, connection is not shared between
+    processes or threads - opening sqlite file is cheap.
+    """
+    os.makedirs(os.path.dirname(config.TILE_CACHE_PATH), exist_ok=True)
+    con = sqlite3.connect(config.TILE_CACHE_PATH, timeout=30)
+    try:
+        con.execute('PRAGMA journal_mode=WAL')
+        con.execute(
+            'CREATE TABLE IF NOT EXISTS tiles ('
+            'z INTEGER, x INTEGER, y INTEGER, layers TEXT, version TEXT, '
+            'etag TEXT, tile_data BLOB, '
+            'PRIMARY KEY (z, x, y, layers, version))'
+        )
+        yield con
+        con.commit()
+    finally:
+        con.close()
+
+
+def layers_key(layers: dict) -> str:
+    """Canonical text form of requested layers, used as part of cache key"""
+    return ','.join(
+        f"{name}:{';'.join(cols)}" for name, cols in sorted(layers.items())
+    )
+
+
+def make_etag(tile: bytes) -> str:
+    return hashlib.md5(
+        config.TILE_CACHE_VERSION.encode() + tile
+    ).hexdigest()
+
+
+def get(z: int, x: int, y: int, layers: dict) -> tuple:
+    """Returns (tile, etag) from cache or None if tile is not cached"""
+    if not config.TILE_CACHE:
+        return None
+    try:
+        with cache_db() as con:
+            row = con.execute(
+                'SELECT tile_data, etag FROM tiles WHERE z=? AND x=? AND y=? '
+                'AND layers=? AND version=?',
+                (z, x, y, layers_key(layers), config.TILE_CACHE_VERSION)
+            ).fetchone()
+    except CACHE_ERRORS as e:
+        logger.warning('Cannot read tile cache: %s', e)
+        return None
+    if row is None:
+        return None
+    return bytes(row[0]), row[1]
+
+
+def put(z: int, x: int, y: int, layers: dict, tile: bytes) -> str:
+    """Stores tile (empty tiles too) in cache, returns its etag"""
+    etag = make_etag(tile)
+    if not config.TILE_CACHE:
+        return etag
+    try:
+        with cache_db() as con:
+            con.execute(
+                'INSERT OR REPLACE INTO tiles VALUES (?, ?, ?, ?, ?, ?, ?)',
+                (z, x, y, layers_key(layers), config.TILE_CACHE_VERSION, etag,
+                 sqlite3.Binary(tile))
+            )
+    except CACHE_ERRORS as e:
+        logger.warning('Cannot write tile to cache: %s', e)
+    return etag
+
+
+def put_many(layers: dict, items: list) -> None:
+    """Stores list of (z, x, y, tile) in one transaction"""
+    if not config.TILE_CACHE or len(items) == 0:
+        return
+    key = layers_key(layers)
+    try:
+        with cache_db() as con:
+            con.executemany(
+                'INSERT OR REPLACE INTO tiles VALUES (?, ?, ?, ?, ?, ?, ?)',
+                [(z, x, y, key, config.TILE_CACHE_VERSION, make_etag(tile),
+                  sqlite3.Binary(tile)) for z, x, y, tile in items]
+            )
+    except CACHE_ERRORS as e:
+        logger.warning('Cannot write %d tiles to cache: %s', len(items), e)
+
+
+def lonlat_to_tile(lon: float, lat: float, z: int) -> tuple:
+    """Returns x, y of tile (web mercator, XYZ scheme) containing point"""
+    lat = max(min(lat, 85.0511), -85.0511)
+    n = 2 ** z
+    x = int((lon + 180.0) / 360.0 * n)
+    y = int(
+        (1.0 - math.asinh(math.tan(math.radians(lat))) / math.pi) / 2.0 * n
+    )
+    return min(max(x, 0), n - 1), min(max(y, 0), n - 1)
+
+
+def tile_bounds(z: int, x: int, y: int) -> tuple:
+    """Returns lon/lat bounds (xmin, ymin, xmax, ymax) of XYZ tile"""
+    n = 2 ** z
+
+    def lat(yy):
+        return math.degrees(math.atan(math.sinh(math.pi * (1 - 2 * yy / n))))
+
+    lon_min = x / n * 360.0 - 180.0
+    lon_max = (x + 1) / n * 360.0 - 180.0
+    return lon_min, lat(y + 1), lon_max, lat(y)
+
+
+def tile_range(bounds: list, z: int) -> tuple:
+    """Returns xmin, ymin, xmax, ymax of tiles covering bounds (EPSG:4326)"""
+    xmin, ymin = lonlat_to_tile(bounds[0], bounds[3], z)
+    xmax, ymax = lonlat_to_tile(bounds[2], bounds[1], z)
+    return xmin, ymin, xmax, ymax
+
+
+def invalidate(bounds: list) -> int:
+    """
+    Deletes cached tiles (all versions and layers) intersecting bounds
+    [xmin, ymin, xmax, ymax] in EPSG:4326, returns number of deleted tiles.
+    Missing cache file is not created - import often runs as other user
+    than API, file owned by it could not be written by API.
+    """
+    if not config.TILE_CACHE or not os.path.isfile(config.TILE_CACHE_PATH):
+        return 0
+    deleted = 0
+    try:
+        with cache_db() as con:
+            for z in range(MAX_ZOOM + 1):
+                xmin, ymin, xmax, ymax = tile_range(bounds, z)
+                deleted += con.execute(
+                    'DELETE FROM tiles WHERE z=? AND x BETWEEN ? AND ? '
+                    'AND y BETWEEN ? AND ?',
+                    (z, xmin, xmax, ymin, ymax)
+                ).rowcount
+    except CACHE_ERRORS as e:
+        logger.warning('Cannot invalidate tile cache: %s', e)
+        return 0
+    return deleted
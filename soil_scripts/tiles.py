@@ -0,0 +1,147 @@
+import math
+
+import sqlalchemy as sa
+
+from . import config
+from .db import sync_session
+
+# web mercator world width in meters
+WORLD_SIZE = 2 * math.pi * 6378137
+
+# layers read from ssurgo.poly_aggreg_mat (see db_scripts/poly_aggreg_mat.sql)
+SOURCE = 'ssurgo.poly_aggreg_mat'
+
+
+def intersects(geom: str, bbox_only: bool = False) -> str:
+    """
+    Condition selecting poly_aggreg_mat rows (alias pa) intersecting geom sql
+    expression (or only its bbox), test is done on small subdivided pieces
+    when config.USE_SUBDIVIDED is set (see db_scripts/mupolygon_subdiv.sql).
+    geom can refer to other relations of query (bounds, aoi), semi-join by
+    EXISTS lets planner find pieces by their GIST index first and then rows
+    by id - IN with correlated subquery is run for every row of pa
+    """
+    def test(col):
+        if bbox_only:
+            return f'{col} && {geom}'
+        return f'ST_Intersects({col}, {geom})'
+
+    if not config.USE_SUBDIVIDED:
+        return test('pa.geometry')
+    return (
+        'EXISTS (SELECT 1 FROM ssurgo.mupolygon_subdiv AS sd '
+        f'WHERE sd.id = pa.id AND {test("sd.geometry")})'
+    )
+
+
+def source_geom(tolerance: float, alias: str = 'pa') -> str:
+    """
+    Returns most simplified geometry column of poly_aggreg_mat which is still
+    finer than tolerance (meters), see config.GEOM_LEVELS
+    """
+    for col, tol in sorted(
+        config.GEOM_LEVELS.items(), key=lambda xx: -xx[1]
+    ):
+        if tolerance >= tol:
+            return f'{alias}.{col}'
+    return f'{alias}.geometry'
+
+
+def tile_tolerance(z: int) -> float:
+    """
+    Simplification tolerance in EPSG:3857 meters for zoom level, geometries
+    are simplified to TILE_SIMPLIFY_PX tile grid cells. From
+    TILE_SIMPLIFY_MAX_ZOOM full geometry is used.
+    """
+    if z >= config.TILE_SIMPLIFY_MAX_ZOOM:
+        return 0
+    cell = (WORLD_SIZE / 2 ** z) / config.TILE_EXTENT
+    return cell * config.TILE_SIMPLIFY_PX
+
+
+def parse_layers(layers: str = None) -> dict:
+    """
+    Returns layers to render as dict layer: columns. Layers are passed as
+    comma separated names from config.TILE_LAYERS, unknown names are skipped.
+    Single layer can be restricted to chosen attributes by 'layer:col1;col2'
+    """
+    if not layers:
+        return dict(config.TILE_LAYERS)
+    out = {}
+    for item in layers.split(','):
+        name, _, cols = item.strip().partition(':')
+        if name not in config.TILE_LAYERS:
+            continue
+        allowed = config.TILE_LAYERS[name]
+        if cols:
+            sel = [xx for xx in cols.split(';') if xx in allowed]
+            if 'mukey' not in sel:
+                sel.insert(0, 'mukey')
+        else:
+            sel = list(allowed)
+        out[name] = sel
+    return out
+
+
+def tile_sql(layers: dict, tolerance: float = 0) -> str:
+    """
+    Builds query returning one bytea row with all requested layers encoded as
+    Mapbox Vector Tile, query expects z, x, y, tolerance bind parameters.
+    Geometries are simplified with tolerance (EPSG:3857 meters)
+    """
+    columns = []
+    for cols in layers.values():
+        columns += [xx for xx in cols if xx not in columns]
+
+    geom = f'ST_Transform({source_geom(tolerance)}, 3857)'
+    if tolerance > 0:
+        geom = f'ST_SimplifyPreserveTopology({geom}, :tolerance)'
+
+    select_cols = ',\n            '.join(f'pa.{xx}' for xx in columns)
+    mvt = ' ||\n        '.join(
+        f"COALESCE((SELECT ST_AsMVT(t, '{name}', {config.TILE_EXTENT}, "
+        f"'geom') FROM (SELECT geom, {', '.join(cols)} FROM features "
+        "WHERE geom IS NOT NULL) AS t), ''::bytea)"
+        for name, cols in layers.items()
+    )
+    return f'''
+    WITH bounds AS (
+        SELECT ST_TileEnvelope(:z, :x, :y) AS geom
+    ),
+    features AS (
+        SELECT
+            ST_AsMVTGeom(
+                {geom},
+                bounds.geom, {config.TILE_EXTENT}, {config.TILE_BUFFER}, true
+            ) AS geom,
+            {select_cols}
+        FROM
+            {SOURCE} AS pa,
+            bounds
+        WHERE {intersects('ST_Transform(bounds.geom, 4326)', True)}
+    )
+    SELECT
+        {mvt}
+        AS tile;
+    '''
+
+
+def valid_tile(z: int, x: int, y: int) -> bool:
+    return 0 <= z <= 22 and 0 <= x < 2 ** z and 0 <= y < 2 ** z
+
+
+def get_tile(z: int, x: int, y: int, layers: dict = None) -> bytes:
+    """
+    Renders vector tile for z/x/y in PostGIS, returns empty bytes when there
+    is nothing to draw (or zoom is below config.TILE_MIN_ZOOM)
+    """
+    if z < config.TILE_MIN_ZOOM or not valid_tile(z, x, y):
+        return b''
+    layers = layers or parse_layers()
+    tolerance = tile_tolerance(z)
+    sql = tile_sql(layers, tolerance)
+    with sync_session() as session:
+        tile = session.execute(
+            sa.text(sql), {'z': z, 'x': x, 'y': y, 'tolerance': tolerance}
+        ).scalar()
+    return bytes(tile) if tile else b''
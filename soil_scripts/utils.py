@@ -1,20 +1,46 @@
-from . import config
-from .db import sync_session
+import logging
+
 import pandas as pd
-from datetime import datetime
 
+from .importlog import get_logger
+
+
+def log_event(txt, ltype: str = 'info', **fields) -> None:
+    """
+    Writes event to ssurgo.importlog by buffered import logger (see
+    importlog), ltype - 'info', 'ERROR' or other logging level name, fields -
+    structured fields: state, stage, rows, duration [s]
+    """
+    level = logging.getLevelName(ltype.upper())
+    if not isinstance(level, int):
+        level = logging.INFO
+    get_logger().log(level, txt, extra=fields)
+
+
+def weighted_aggregate(df: pd.DataFrame, columns: dict,
+                       weight: str = 'comppct_r',
+                       by: str = 'mukey') -> pd.DataFrame:
+    """
+    Component values aggregated per mukey, weighted by percent of component
+    in map unit, all columns are calculated in one groupby.
+    columns - output column: (component column, how), how is one of
+    - 'sum' - sum of weight/100 * value
+    - 'mean' - weighted mean
+    Null values are skipped, mukeys without any value get null
+    """
+    wgt = df[weight] / 100
+    parts = {by: df[by]}
+    for out, (col, how) in columns.items():
+        if how not in ['sum', 'mean']:
+            raise ValueError(f'Unknown aggregation {how} for {out}')
+        val = df[col].astype(float)
+        parts[f'{out}_value'] = wgt * val
+        parts[f'{out}_weight'] = wgt.where(val.notna())
+    grp = pd.DataFrame(parts).groupby(by).sum(min_count=1)
 
-def log_event(txt, ltype: str= 'info') -> None:
-    with sync_session() as session:
-        eng = session.get_bind()
-        pd.DataFrame({
-            'timelog': [datetime.now()],
-            'description': [txt],
-            'ltype': ltype,
-        }).to_sql(
-            name='importlog',
-            con=eng,
-            schema='ssurgo',
-            if_exists='append',
-            index=False
-        )
+    res = pd.DataFrame(index=grp.index)
+    for out, (col, how) in columns.items():
+        res[out] = grp[f'{out}_value']
+        if how == 'mean':
+            res[out] = res[out] / grp[f'{out}_weight']
+    return res.reset_index()